@@ -1,11 +1,75 @@
-from django.contrib import admin
-from .models import RoomBooking
+from django import forms
+from django.contrib import admin, messages
+from .models import ArchivedRoomBooking, ProviderBookingRollup, RoomBooking
+from .state_machine import can_transition, transition
 
 # Register your models here.
 
 
+class RoomBookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = RoomBooking
+        fields = ['status']
+
+    def clean_status(self):
+        old_status = self.initial['status']
+        new_status = self.cleaned_data['status']
+        if new_status != old_status and not can_transition(old_status, new_status):
+            raise forms.ValidationError(f'A {old_status} booking cannot become {new_status}.')
+        return new_status
+
+
 @admin.register(RoomBooking)
 class RoomBookingAdmin(admin.ModelAdmin):
+    # bookings are made through reserve_room and only their status changes
+    # here, through the state machine, so the ledger, rollups, change feed
+    # and search cache follow admin edits too
+    form = RoomBookingAdminForm
     list_display = ('id', 'user', 'room', 'provider', 'check_in', 'check_out', 'status', 'total_price')
     list_filter = ('status', 'check_in', 'check_out')
     search_fields = ('user__full_name', 'room_id', 'provider__display_name')
+    fields = (
+        'status', 'user', 'provider', 'room_type', 'room_id',
+        'check_in', 'check_out', 'total_price', 'created_at', 'updated_at',
+    )
+    readonly_fields = fields[1:]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # cancel instead, a deleted booking would skip the rollup and feed
+        return False
+
+    def save_model(self, request, obj, form, change):
+        new_status = obj.status
+        obj.status = form.initial['status']
+        if new_status != obj.status and not transition(obj, new_status):
+            self.message_user(
+                request,
+                f'Booking {obj.id} changed while you edited it, its status was not saved.',
+                messages.ERROR,
+            )
+
+
+@admin.register(ProviderBookingRollup)
+class ProviderBookingRollupAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'pending_count', 'confirmed_count', 'completed_count', 'revenue', 'updated_at')
+    search_fields = ('provider__display_name',)
+
+
+@admin.register(ArchivedRoomBooking)
+class ArchivedRoomBookingAdmin(admin.ModelAdmin):
+    # a cold copy read back by the rollup rebuild and exports, view only
+    list_display = ('id', 'user', 'provider', 'check_in', 'check_out', 'status', 'total_price', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('user__full_name', 'room_id', 'provider__display_name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
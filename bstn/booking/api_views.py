@@ -1,19 +1,33 @@
 from datetime import date
-from rest_framework import generics, permissions, status
+from rest_framework import generics, permissions, serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from accounts.models import ProviderProfile
-from .models import RoomBooking
-from .services import auto_complete_finished_bookings
-from .serializer import RoomBookingSerializer, RoomBookingCreateSerializer, BookingDetailSerializer
+from .export import EXPORT_FORMATS, export_rows
+from .models import ArchivedRoomBooking, RoomBooking
+from .pagination import CreatedAtKeysetPagination
+from .services import get_booking_events, get_provider_dashboard, prefetch_booking_details
+from .state_machine import bulk_transition_pending, transition
+from .serializer import (
+    RoomBookingSerializer,
+    RoomBookingCreateSerializer,
+    BookingDetailSerializer,
+    GroupRoomBookingCreateSerializer,
+    ProviderDashboardSerializer,
+    BulkBookingTransitionSerializer,
+    BookingEventSerializer,
+    BookingExportSerializer,
+)
 from accounts.permissions import IsGuest, IsProvider, IsAdmin
 
 
 # Read only list for all room bookings
 class RoomBookingListAPIView(generics.ListAPIView):
-    queryset = RoomBooking.objects.all().order_by('-created_at')
+    queryset = RoomBooking.objects.select_related('room_type').order_by('-created_at')
     serializer_class = RoomBookingSerializer
+    pagination_class = CreatedAtKeysetPagination
 
 
 class RoomBookingCreateAPIView(generics.CreateAPIView):
@@ -34,31 +48,178 @@ class RoomBookingCreateAPIView(generics.CreateAPIView):
         return Response(detail.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class MyRoomBookingsAPIView(generics.ListAPIView):
+class GroupRoomBookingCreateAPIView(generics.CreateAPIView):
+    # books several rooms for the same dates in one all or nothing request
+    serializer_class = GroupRoomBookingCreateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bookings = serializer.save()
+
+        return Response({
+            'check_in': serializer.validated_data['check_in'],
+            'check_out': serializer.validated_data['check_out'],
+            'total_price': serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(
+                sum(booking.total_price for booking in bookings)
+            ),
+            'bookings': RoomBookingSerializer(bookings, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+
+class WithArchivedBookingsMixin:
+    # lists the view's bookings from the live and archived tables merged
+    # newest first, paged together by CreatedAtKeysetPagination.paginate_sources.
+    # bookings(model) narrows either table the same way.
+    archived_model = ArchivedRoomBooking
+
+    def get_queryset(self):
+        return self.bookings(RoomBooking)
+
+    def get_archived_queryset(self):
+        return self.bookings(self.archived_model)
+
+    def list(self, request, *args, **kwargs):
+        sources = [
+            self.filter_queryset(self.get_queryset()),
+            self.filter_queryset(self.get_archived_queryset()),
+        ]
+        page = self.paginator.paginate_sources(sources, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class MyRoomBookingsAPIView(WithArchivedBookingsMixin, generics.ListAPIView):
     serializer_class = BookingDetailSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtKeysetPagination
     # only logged in user can see their bookings
 
-    # get_queryset narrows to bookings of 'request.user'
-    def get_queryset(self):
-        # auto complete finished bookings on each call
-        auto_complete_finished_bookings()
-        return RoomBooking.objects.filter(
-            user=self.request.user
-        ).order_by('-created_at') 
+    # bookings narrows to bookings of 'request.user'
+    def bookings(self, model):
+        # finished bookings are completed by the complete_bookings sweeper,
+        # the serializer already shows them as COMPLETED.
+        return prefetch_booking_details(model.objects.filter(user=self.request.user))
 
 
-class ProviderBookingsAPIView(generics.ListAPIView):
+class ProviderBookingsAPIView(WithArchivedBookingsMixin, generics.ListAPIView):
     serializer_class = RoomBookingSerializer
     permission_classes = [permissions.IsAuthenticated, IsProvider]
+    pagination_class = CreatedAtKeysetPagination
 
-    def get_queryset(self):
-        # auto complete finished bookings on each call
-        auto_complete_finished_bookings()
-        provider_id = self.kwargs['provider_id']
-        return RoomBooking.objects.filter(
-            provider_id=provider_id
-        ).order_by('-created_at')
+    def bookings(self, model):
+        # finished bookings are completed by the complete_bookings sweeper
+        return model.objects.filter(provider_id=self.kwargs['provider_id']).select_related('room_type')
+
+
+class ProviderDashboardAPIView(APIView):
+    # status counts, revenue and upcoming check ins for one provider
+    permission_classes = [permissions.IsAuthenticated, IsProvider]
+
+    def get(self, request, provider_id):
+        provider = get_object_or_404(ProviderProfile, id=provider_id)
+
+        # OwnerShip check - providers only see their own numbers
+        if provider.user_id != request.user.id:
+            return Response(
+                {'detail': 'Not authorized to view this dashboard.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = ProviderDashboardSerializer(get_provider_dashboard(provider))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class BulkBookingTransitionAPIView(APIView):
+    # confirm or reject many pending bookings of the calling provider at once
+    permission_classes = [permissions.IsAuthenticated, IsProvider]
+
+    def post(self, request):
+        serializer = BulkBookingTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data['action']
+
+        outcomes = bulk_transition_pending(
+            request.user.provider_profile,
+            serializer.validated_data['booking_ids'],
+            BulkBookingTransitionSerializer.ACTION_STATUS[action],
+        )
+
+        return Response({
+            'action': action,
+            'applied': sum(outcome == 'applied' for outcome in outcomes.values()),
+            'results': [
+                {'id': booking_id, 'result': outcome}
+                for booking_id, outcome in outcomes.items()
+            ],
+        }, status=status.HTTP_200_OK)
+
+
+class BookingEventFeedAPIView(APIView):
+    # change feed for downstream consumers, pass the next_since of the
+    # previous answer as since and keep polling while has_more is true
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    # Largest batch a single request may read
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', 500))
+        except ValueError:
+            return Response(
+                {'detail': 'since and limit must be integers.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if since < 0 or limit < 1:
+            return Response(
+                {'detail': 'since cannot be negative and limit must be positive.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        events, has_more = get_booking_events(since, min(limit, self.MAX_LIMIT))
+        return Response({
+            'events': BookingEventSerializer(events, many=True).data,
+            'next_since': events[-1].id if events else since,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
+
+
+class BookingExportAPIView(APIView):
+    # streams bookings as CSV or NDJSON, admins may export any provider,
+    # providers only their own bookings
+    # ?output=csv|ndjson&provider=&status=&check_in_from=&check_in_to=
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        serializer = BookingExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+        provider_id = filters.pop('provider', None)
+
+        if not (request.user.is_staff or request.user.is_superuser):
+            try:
+                provider_id = request.user.provider_profile.id
+            except ProviderProfile.DoesNotExist:
+                return Response(
+                    {'detail': 'Only providers and admins can export bookings.'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
+        stream, content_type = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            stream(export_rows(provider_id=provider_id, **filters)),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="bookings.{output}"'
+        return response
+
+
+# answer for a transition that lost the race to another request
+LOST_TRANSITION = {'detail': 'Booking was changed by another request, reload and try again.'}
 
 
 class CancelRoomBookingAPIView(APIView):
@@ -69,7 +230,7 @@ class CancelRoomBookingAPIView(APIView):
         booking = get_object_or_404(RoomBooking, id=booking_id)
 
         # OwnerShip check
-        if booking.user != request.user:
+        if booking.user_id != request.user.id:
             return Response(
                 {'detail': 'Not authorized to cancel this booking.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -89,9 +250,10 @@ class CancelRoomBookingAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Finally if all rules passed cancel the booking
-        booking.status = 'CANCELLED'
-        booking.save()
+        # Finally if all rules still hold cancel the booking,
+        # the state machine hands its nights back to the ledger
+        if not transition(booking, 'CANCELLED', user=request.user, check_in__gt=date.today()):
+            return Response(LOST_TRANSITION, status=status.HTTP_409_CONFLICT)
 
         # Return the updated booking 
         serialzer = RoomBookingSerializer(booking)
@@ -115,7 +277,7 @@ class ConfirmRoomBookingAPIView(APIView):
             )
 
         # OwnerShip check - only provider can confirm
-        if booking.provider != provider_profile:
+        if booking.provider_id != provider_profile.id:
             return Response(
                 {'detail': 'Not authorized to confirm this booking.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -128,9 +290,9 @@ class ConfirmRoomBookingAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Finally if all rules passed confirm the booking
-        booking.status = 'CONFIRMED'
-        booking.save()
+        # Finally if the booking is still pending confirm it
+        if not transition(booking, 'CONFIRMED', provider=provider_profile):
+            return Response(LOST_TRANSITION, status=status.HTTP_409_CONFLICT)
 
         # Return the updated booking
         seraializer = RoomBookingSerializer(booking)
@@ -155,7 +317,7 @@ class RejectRoomBookinAPIView(APIView):
             )
         
         # Ownership check - only provider can reject
-        if booking.provider != provider_profile:
+        if booking.provider_id != provider_profile.id:
             return Response(
                 {'detail': 'Not authorized to reject this booking.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -168,15 +330,11 @@ class RejectRoomBookinAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Finally if all rules passed reject the booking
-        booking.status = 'REJECTED'
-        booking.save()
+        # Finally if the booking is still pending reject it,
+        # the state machine hands its nights back to the ledger
+        if not transition(booking, 'REJECTED', provider=provider_profile):
+            return Response(LOST_TRANSITION, status=status.HTTP_409_CONFLICT)
 
         # Return the updated booking
         serializer = RoomBookingSerializer(booking)
         return Response(serializer.data, status=status.HTTP_200_OK)
-    
-
-
-
-    
\ No newline at end of file
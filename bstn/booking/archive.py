@@ -0,0 +1,49 @@
+# booking/archive.py
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArchivedRoomBooking, RoomBooking
+
+# Bookings in these statuses never change again and can be archived
+TERMINAL_STATUSES = ['COMPLETED', 'CANCELLED', 'REJECTED']
+
+# every RoomBooking column, copied as is
+ARCHIVE_FIELDS = [field.attname for field in RoomBooking._meta.concrete_fields]
+
+
+def archive_finished_bookings(older_than_days=None, batch_size=1000, today=None):
+    """
+    Move terminal bookings whose check_out is more than older_than_days
+    ago from RoomBooking to ArchivedRoomBooking.
+
+    Each batch is copied and deleted in one transaction, walking ids
+    upwards, so an interrupted run loses nothing and the next run simply
+    carries on with what is left. Returns the number of bookings moved.
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'BOOKING_ARCHIVE_AFTER_DAYS', 365)
+    cutoff = (today or date.today()) - timedelta(days=older_than_days)
+    moved = 0
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(RoomBooking.objects.select_for_update().filter(
+                status__in=TERMINAL_STATUSES,
+                check_out__lt=cutoff,
+                id__gt=last_id,
+            ).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+
+            # ignore_conflicts keeps a rerun over a half restored table safe
+            ArchivedRoomBooking.objects.bulk_create(
+                [ArchivedRoomBooking(**row) for row in rows],
+                ignore_conflicts=True,
+            )
+            ids = [row['id'] for row in rows]
+            RoomBooking.objects.filter(id__in=ids, status__in=TERMINAL_STATUSES).delete()
+        moved += len(rows)
+        last_id = ids[-1]
@@ -0,0 +1,105 @@
+# booking/export.py
+import csv
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, CharField, F, OuterRef, Subquery, When
+
+from listings.services import STAY_CONFIG
+from .models import ArchivedRoomBooking, RoomBooking
+
+# columns of an export, in order
+EXPORT_FIELDS = [
+    'id',
+    'status',
+    'check_in',
+    'check_out',
+    'total_price',
+    'created_at',
+    'user_id',
+    'guest_name',
+    'provider_id',
+    'provider_name',
+    'room_type_name',
+    'room_id',
+    'room_name',
+    'stay_name',
+]
+
+# rows fetched per round trip while streaming
+CHUNK_SIZE = 2000
+
+
+def per_room_model(field):
+    # Case picking field of the booked room, one correlated subquery per room model
+    whens = []
+    for cfg in STAY_CONFIG.values():
+        room_model = cfg['room_model']
+        whens.append(When(
+            room_type_id=ContentType.objects.get_for_model(room_model).id,
+            then=Subquery(room_model.objects.filter(id=OuterRef('room_id')).values(
+                field.format(stay=cfg['stay_attr'])
+            )[:1]),
+        ))
+    return Case(*whens, default=None, output_field=CharField())
+
+
+def export_rows(provider_id=None, status=None, check_in_from=None, check_in_to=None):
+    """
+    Lazy querysets of export rows as dicts with EXPORT_FIELDS keys, live
+    bookings first, then archived ones.
+    Guest, provider, room and stay names come from joins and subqueries
+    in the same SELECT, so streaming costs one query per chunk.
+    """
+    return [
+        export_queryset(model, provider_id, status, check_in_from, check_in_to)
+        for model in (RoomBooking, ArchivedRoomBooking)
+    ]
+
+
+def export_queryset(model, provider_id, status, check_in_from, check_in_to):
+    bookings = model.objects.all()
+    if provider_id is not None:
+        bookings = bookings.filter(provider_id=provider_id)
+    if status:
+        bookings = bookings.filter(status=status)
+    if check_in_from:
+        bookings = bookings.filter(check_in__gte=check_in_from)
+    if check_in_to:
+        bookings = bookings.filter(check_in__lte=check_in_to)
+
+    return bookings.annotate(
+        guest_name=F('user__full_name'),
+        provider_name=F('provider__display_name'),
+        room_type_name=F('room_type__model'),
+        room_name=per_room_model('room_name'),
+        stay_name=per_room_model('{stay}__name'),
+    ).order_by('id').values(*EXPORT_FIELDS)
+
+
+class Echo:
+    # file-like object whose write() hands the line back to the caller
+    def write(self, value):
+        return value
+
+
+def iter_csv(querysets):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for rows in querysets:
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def iter_ndjson(querysets):
+    for rows in querysets:
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+# output format -> (line generator, content type)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.archive import archive_finished_bookings
+
+
+class Command(BaseCommand):
+    help = (
+        'Move finished (completed, cancelled, rejected) bookings out of the '
+        'hot RoomBooking table. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Archive bookings that checked out this many days ago. '
+                 'Defaults to BOOKING_ARCHIVE_AFTER_DAYS.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moved = archive_finished_bookings(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Archived {moved} bookings in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import RoomNight
+from booking.services import backfill_room_nights, check_room_night_ledger
+
+
+class Command(BaseCommand):
+    help = 'Fill the room night ledger from existing active bookings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop every ledger row before filling it again.',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            deleted, _ = RoomNight.objects.all().delete()
+            self.stdout.write(f'Removed {deleted} ledger rows.')
+
+        visited = backfill_room_nights(batch_size=options['batch_size'])
+        self.stdout.write(f'Visited {visited} active bookings.')
+
+        report = check_room_night_ledger()
+        if report['missing'] or report['stale']:
+            self.stdout.write(self.style.WARNING(
+                f"Ledger still inconsistent: {len(report['missing'])} bookings missing nights, "
+                f"{len(report['stale'])} stale rows. Run check_room_nights for details."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Room night ledger is consistent.'))
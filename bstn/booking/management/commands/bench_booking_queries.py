@@ -0,0 +1,185 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import User, ProviderProfile
+from booking.models import RoomBooking, RoomNight
+from booking.services import ACTIVE_STATUSES, booked_room_ids, stay_nights
+from listings.models import HotelRoom
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with bookings and their room nights and time '
+        'the hot queries with and without the composite indexes, printing '
+        'EXPLAIN output.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000)
+        parser.add_argument('--rooms', type=int, default=20_000)
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--providers', type=int, default=2_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        # never touch the real database, the test database is dropped at the end
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options)
+            queries = self.hot_queries(options)
+
+            before = self.measure(queries, options['repeat'], drop_indexes=True)
+            after = self.measure(queries, options['repeat'], drop_indexes=False)
+
+            self.stdout.write('')
+            self.stdout.write(f"{'query':<20}{'before ms':>12}{'after ms':>12}")
+            for label in queries:
+                self.stdout.write(f'{label:<20}{before[label]:>12.3f}{after[label]:>12.3f}')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        rnd = random.Random(42)
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        User.objects.bulk_create(
+            [
+                User(username=f'bench{i}', phone=f'bench{i}', full_name=f'Bench {i}')
+                for i in range(options['users'])
+            ],
+            batch_size=batch_size,
+        )
+        user_ids = list(User.objects.values_list('id', flat=True))
+
+        ProviderProfile.objects.bulk_create(
+            [
+                ProviderProfile(
+                    user_id=user_id,
+                    display_name=f'Provider {user_id}',
+                    business_type='COMPANY',
+                    description='',
+                    country='BD',
+                    city='Dhaka',
+                    address='Road 1',
+                    phone='0',
+                )
+                for user_id in user_ids[:options['providers']]
+            ],
+            batch_size=batch_size,
+        )
+        provider_ids = list(ProviderProfile.objects.values_list('id', flat=True))
+
+        room_ct = ContentType.objects.get_for_model(HotelRoom)
+        statuses = ['PENDING', 'CONFIRMED', 'CANCELLED', 'COMPLETED', 'REJECTED']
+        weights = [10, 20, 15, 50, 5]
+        today = date.today()
+
+        created = 0
+        while created < options['rows']:
+            size = min(batch_size, options['rows'] - created)
+            batch = []
+            for _ in range(size):
+                check_in = today + timedelta(days=rnd.randint(-730, 365))
+                batch.append(RoomBooking(
+                    user_id=rnd.choice(user_ids),
+                    provider_id=rnd.choice(provider_ids),
+                    room_type=room_ct,
+                    room_id=rnd.randint(1, options['rooms']),
+                    check_in=check_in,
+                    check_out=check_in + timedelta(days=rnd.randint(1, 7)),
+                    status=rnd.choices(statuses, weights)[0],
+                ))
+            RoomBooking.objects.bulk_create(batch)
+            # the ledger availability reads, first booking of a night wins
+            RoomNight.objects.bulk_create(
+                [
+                    RoomNight(booking=booking, room_type=room_ct, room_id=booking.room_id, night=night)
+                    for booking in batch
+                    if booking.status in ACTIVE_STATUSES
+                    for night in stay_nights(booking.check_in, booking.check_out)
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            created += size
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE booking_roombooking')
+                cursor.execute('ANALYZE booking_roomnight')
+
+        self.stdout.write(
+            f"Seeded {options['rows']} bookings and {RoomNight.objects.count()} room nights "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    def hot_queries(self, options):
+        room_ct = ContentType.objects.get_for_model(HotelRoom)
+        check_in = date.today() + timedelta(days=30)
+        check_out = check_in + timedelta(days=3)
+        user_id = User.objects.order_by('id').values_list('id', flat=True).first()
+        provider_id = ProviderProfile.objects.order_by('id').values_list('id', flat=True).first()
+
+        # the querysets the request path runs, keyed by a short label
+        return {
+            # search and the booking pre-check, answered from the RoomNight ledger
+            'booked_room_ids': booked_room_ids(room_ct, check_in, check_out),
+            'room_night_claim': RoomNight.objects.filter(
+                room_type=room_ct,
+                room_id=options['rooms'] // 2,
+                night__gte=check_in,
+                night__lt=check_out,
+            ).values('id')[:1],
+            'room_overlap': RoomBooking.objects.filter(
+                room_type=room_ct,
+                room_id=options['rooms'] // 2,
+                status__in=ACTIVE_STATUSES,
+                check_in__lt=check_out,
+                check_out__gt=check_in,
+            ).values('id')[:1],
+            'auto_complete': RoomBooking.objects.filter(
+                status='CONFIRMED',
+                check_out__lt=date.today() - timedelta(days=700),
+            ).values('id'),
+            'my_bookings': RoomBooking.objects.filter(
+                user_id=user_id,
+            ).order_by('-created_at', '-id')[:20],
+            'provider_bookings': RoomBooking.objects.filter(
+                provider_id=provider_id,
+            ).order_by('-created_at', '-id')[:20],
+        }
+
+    def measure(self, queries, repeat, drop_indexes):
+        with connection.schema_editor() as editor:
+            for model in (RoomBooking, RoomNight):
+                for index in model._meta.indexes:
+                    if drop_indexes:
+                        editor.remove_index(model, index)
+                    else:
+                        editor.add_index(model, index)
+
+        heading = 'without composite indexes' if drop_indexes else 'with composite indexes'
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {heading} =='))
+
+        results = {}
+        for label, queryset in queries.items():
+            self.stdout.write(f'-- {label}')
+            self.stdout.write(queryset.explain())
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = statistics.median(timings)
+        return results
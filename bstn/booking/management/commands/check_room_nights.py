@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.services import check_room_night_ledger
+
+
+class Command(BaseCommand):
+    help = 'Compare the room night ledger against RoomBooking and report drift.'
+
+    def handle(self, *args, **options):
+        report = check_room_night_ledger()
+
+        for booking_id in report['missing']:
+            self.stdout.write(f'Booking #{booking_id} does not own all of its nights.')
+        for room_night_id in report['stale']:
+            self.stdout.write(f'Room night #{room_night_id} has no matching active booking.')
+
+        if report['missing'] or report['stale']:
+            raise CommandError(
+                f"{len(report['missing'])} bookings missing nights, "
+                f"{len(report['stale'])} stale ledger rows."
+            )
+
+        self.stdout.write(self.style.SUCCESS('Room night ledger is consistent.'))
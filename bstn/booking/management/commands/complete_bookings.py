@@ -0,0 +1,39 @@
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from booking.state_machine import auto_complete_finished_bookings
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark CONFIRMED bookings whose stay has ended as COMPLETED. '
+        'Run it from cron after midnight, or keep it running with --loop.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Sweep now, then again at every day boundary.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options['batch_size'])
+            if not options['loop']:
+                return
+
+            # a stay can only end once a day, so sleep until tomorrow
+            tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+            time.sleep(max((tomorrow - datetime.now()).total_seconds(), 1))
+
+    def sweep(self, batch_size):
+        started = time.perf_counter()
+        touched = auto_complete_finished_bookings(batch_size=batch_size)
+        self.stdout.write(
+            f'{datetime.now():%Y-%m-%d %H:%M:%S} completed {touched} bookings '
+            f'in {time.perf_counter() - started:.2f}s'
+        )
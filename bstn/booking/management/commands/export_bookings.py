@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from booking.export import EXPORT_FORMATS, export_rows
+from booking.models import RoomBooking
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings as CSV or NDJSON to stdout or a file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--file', help='Write here instead of stdout.')
+        parser.add_argument('--provider', type=int)
+        parser.add_argument('--status', choices=[value for value, _ in RoomBooking.STATUS_CHOICE])
+        parser.add_argument('--check-in-from', type=date.fromisoformat)
+        parser.add_argument('--check-in-to', type=date.fromisoformat)
+
+    def handle(self, *args, **options):
+        stream, _ = EXPORT_FORMATS[options['output']]
+        lines = stream(export_rows(
+            provider_id=options['provider'],
+            status=options['status'],
+            check_in_from=options['check_in_from'],
+            check_in_to=options['check_in_to'],
+        ))
+
+        if not options['file']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        written = 0
+        with open(options['file'], 'w', newline='') as out:
+            for line in lines:
+                out.write(line)
+                written += 1
+        self.stderr.write(f"Wrote {written} lines to {options['file']}.")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from booking.services import rebuild_provider_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute provider booking rollups from RoomBooking and repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider_ids', nargs='*', type=int, help='Only rebuild these providers.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        repaired = rebuild_provider_rollups(
+            provider_ids=options['provider_ids'] or None,
+            batch_size=options['batch_size'],
+        )
+        if repaired:
+            self.stdout.write(self.style.WARNING(f'Repaired {repaired} drifted provider rollups.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Provider rollups are consistent.'))
@@ -0,0 +1,146 @@
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, time as clock, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Exists, OuterRef
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User, ProviderProfile
+from booking.models import RoomBooking
+from booking.services import ACTIVE_STATUSES, check_room_night_ledger
+from listings.models import Hotel, HotelRoom
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent booking create requests from many threads against a '
+        'throwaway database, then check that no two active bookings overlap.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--days', type=int, default=30, help='Window the check in dates fall in.')
+
+    def handle(self, *args, **options):
+        # threads need a database they can all open, so SQLite gets a temp file
+        temp_path = None
+        if connection.vendor == 'sqlite':
+            temp_path = os.path.join(tempfile.mkdtemp(), 'stress.sqlite3')
+            connection.settings_dict['TEST']['NAME'] = temp_path
+
+        # refused bookings are expected, keep the 400 warnings off the console
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            guests, rooms = self.seed(options)
+            outcomes, elapsed = self.fire(guests, rooms, options)
+            self.report(outcomes, elapsed, options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def seed(self, options):
+        host = User.objects.create_user(username='stress-host', password='x', phone='stress-host', full_name='Host')
+        provider = ProviderProfile.objects.create(
+            user=host,
+            display_name='Stress stays',
+            business_type='COMPANY',
+            description='',
+            country='BD',
+            city='Dhaka',
+            address='Road 1',
+            phone='0',
+        )
+        hotel = Hotel.objects.create(
+            provider=provider,
+            name='Stress Hotel',
+            total_rooms=options['rooms'],
+            check_in_time=clock(14),
+            check_out_time=clock(11),
+            address='Road 1',
+            city='Dhaka',
+            country='BD',
+        )
+        rooms = [
+            HotelRoom.objects.create(hotel=hotel, max_guest_per_room=2, price_per_night=100, room_type='DOUBLE').id
+            for _ in range(options['rooms'])
+        ]
+        guests = [
+            User.objects.create_user(username=f'stress{i}', password='x', phone=f'stress{i}', full_name=f'Guest {i}')
+            for i in range(options['threads'])
+        ]
+        return guests, rooms
+
+    def fire(self, guests, rooms, options):
+        per_thread = options['requests'] // options['threads']
+        outcomes = {}
+        lock = threading.Lock()
+        start_line = threading.Barrier(options['threads'])
+
+        def worker(index, guest):
+            rnd = random.Random(index)
+            client = APIClient()
+            client.force_authenticate(guest)
+            counts = {}
+            start_line.wait()
+            try:
+                for _ in range(per_thread):
+                    check_in = date.today() + timedelta(days=rnd.randint(1, options['days']))
+                    response = client.post(reverse('room-booking-create'), {
+                        'room_type': 'hotel',
+                        'room_id': rnd.choice(rooms),
+                        'check_in': check_in.isoformat(),
+                        'check_out': (check_in + timedelta(days=rnd.randint(1, 4))).isoformat(),
+                    }, format='json')
+                    counts[response.status_code] = counts.get(response.status_code, 0) + 1
+            finally:
+                connections.close_all()
+            with lock:
+                for code, count in counts.items():
+                    outcomes[code] = outcomes.get(code, 0) + count
+
+        threads = [threading.Thread(target=worker, args=(i, guest)) for i, guest in enumerate(guests)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes, time.perf_counter() - started
+
+    def report(self, outcomes, elapsed, options):
+        active = RoomBooking.objects.filter(status__in=ACTIVE_STATUSES)
+        overlaps = active.filter(Exists(
+            active.filter(
+                room_type=OuterRef('room_type'),
+                room_id=OuterRef('room_id'),
+                check_in__lt=OuterRef('check_out'),
+                check_out__gt=OuterRef('check_in'),
+            ).exclude(id=OuterRef('id'))
+        )).count()
+        ledger = check_room_night_ledger()
+        sent = sum(outcomes.values())
+
+        self.stdout.write(f"Requests:   {sent} from {options['threads']} threads in {elapsed:.2f}s")
+        self.stdout.write(f'Throughput: {sent / elapsed:.1f} requests/s')
+        self.stdout.write(f'Created:    {outcomes.get(201, 0)} bookings')
+        self.stdout.write(f'Refused:    {outcomes.get(400, 0)} overlapping requests')
+        self.stdout.write(f'Overlaps:   {overlaps} active bookings overlap another')
+
+        errors = {code: count for code, count in outcomes.items() if code not in (201, 400)}
+        if overlaps or errors or ledger['missing'] or ledger['stale']:
+            raise CommandError(f'Stress run failed: errors={errors} ledger={ledger}')
+        self.stdout.write(self.style.SUCCESS('No double bookings.'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_alter_roombooking_status'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_id', models.PositiveIntegerField()),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_nights', to='booking.roombooking')),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room_type', 'night', 'room_id'], name='room_night_type_night_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room_type', 'room_id', 'night'), name='unique_room_night')],
+            },
+        ),
+    ]
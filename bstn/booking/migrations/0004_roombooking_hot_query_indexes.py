@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('booking', '0003_roomnight'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['room_type', 'room_id', 'status', 'check_in', 'check_out'], name='booking_room_status_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['status', 'check_out'], name='booking_status_checkout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['provider', '-created_at'], name='booking_provider_created_idx'),
+        ),
+    ]
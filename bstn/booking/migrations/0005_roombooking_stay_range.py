@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# PostgreSQL only: a generated daterange column, a GiST index for &&
+# searches and an exclusion constraint so two active bookings of the same
+# room can never overlap. Other backends keep the plain check_in/check_out
+# query path and are left untouched.
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    """
+    ALTER TABLE booking_roombooking
+    ADD COLUMN stay_range daterange
+    GENERATED ALWAYS AS (daterange(check_in, check_out, '[)')) STORED
+    """,
+    """
+    CREATE INDEX booking_stay_range_gist
+    ON booking_roombooking USING gist (room_type_id, stay_range)
+    """,
+    """
+    ALTER TABLE booking_roombooking
+    ADD CONSTRAINT booking_no_overlapping_active
+    EXCLUDE USING gist (room_type_id WITH =, room_id WITH =, stay_range WITH &&)
+    WHERE (status IN ('PENDING', 'CONFIRMED'))
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'ALTER TABLE booking_roombooking DROP CONSTRAINT IF EXISTS booking_no_overlapping_active',
+    'DROP INDEX IF EXISTS booking_stay_range_gist',
+    'ALTER TABLE booking_roombooking DROP COLUMN IF EXISTS stay_range',
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_roombooking_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgres(POSTGRES_FORWARD),
+            run_on_postgres(POSTGRES_BACKWARD),
+        ),
+    ]
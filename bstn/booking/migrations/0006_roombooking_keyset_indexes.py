@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('booking', '0005_roombooking_stay_range'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='roombooking',
+            name='booking_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='roombooking',
+            name='booking_provider_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['provider', '-created_at', '-id'], name='booking_provider_created_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('booking', '0006_roombooking_keyset_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderBookingRollup',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='booking_rollup', serialize=False, to='accounts.providerprofile')),
+                ('pending_count', models.IntegerField(default=0)),
+                ('confirmed_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('rejected_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='roombooking',
+            index=models.Index(fields=['provider', 'check_in'], name='booking_provider_checkin_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_provider_booking_rollup'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event', models.CharField(choices=[('CREATED', 'Created'), ('STATUS_CHANGED', 'Status changed')], max_length=20)),
+                ('booking_id', models.PositiveIntegerField()),
+                ('user_id', models.PositiveIntegerField()),
+                ('provider_id', models.PositiveIntegerField()),
+                ('room_id', models.PositiveIntegerField()),
+                ('check_in', models.DateField()),
+                ('check_out', models.DateField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('old_status', models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed'), ('REJECTED', 'Rejected')], max_length=20)),
+                ('new_status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed'), ('REJECTED', 'Rejected')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+# frozen copy of the ledger fill, availability reads only RoomNight so every
+# active booking made before the ledger existed must own its nights
+ACTIVE_STATUSES = ['PENDING', 'CONFIRMED']
+BATCH_SIZE = 1000
+
+
+def fill_room_nights(apps, schema_editor):
+    RoomBooking = apps.get_model('booking', 'RoomBooking')
+    RoomNight = apps.get_model('booking', 'RoomNight')
+
+    bookings = RoomBooking.objects.filter(status__in=ACTIVE_STATUSES).order_by('id').values_list(
+        'id', 'room_type_id', 'room_id', 'check_in', 'check_out',
+    )
+    nights = []
+    for booking_id, room_type_id, room_id, check_in, check_out in bookings.iterator(chunk_size=BATCH_SIZE):
+        for i in range((check_out - check_in).days):
+            nights.append(RoomNight(
+                booking_id=booking_id,
+                room_type_id=room_type_id,
+                room_id=room_id,
+                night=check_in + timedelta(days=i),
+            ))
+        if len(nights) >= BATCH_SIZE:
+            RoomNight.objects.bulk_create(nights, ignore_conflicts=True)
+            nights = []
+    RoomNight.objects.bulk_create(nights, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_archivedroombooking'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_room_nights, migrations.RunPython.noop),
+    ]
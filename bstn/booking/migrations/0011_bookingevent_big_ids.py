@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_fill_room_nights'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookingevent',
+            name='booking_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='bookingevent',
+            name='provider_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='bookingevent',
+            name='user_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_bookingevent_big_ids'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingevent',
+            name='transaction_id',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bookingevent',
+            index=models.Index(fields=['transaction_id', 'id'], name='bookingevent_feed_order'),
+        ),
+    ]
@@ -7,6 +7,11 @@ from accounts.models import User, ProviderProfile
 
 # Create your models here.
 
+# Only these bookings hold their room nights, in the RoomNight ledger and
+# in every availability query. Kept here rather than in booking.services
+# so listings.availability_index can import it without an import cycle
+ACTIVE_STATUSES = ['PENDING', 'CONFIRMED']
+
 
 class RoomBooking(models.Model):
     STATUS_CHOICE = [
@@ -59,5 +64,175 @@ class RoomBooking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # shaped after the hot queries, see bench_booking_queries
+        indexes = [
+            # overlap check for one room
+            models.Index(
+                fields=['room_type', 'room_id', 'status', 'check_in', 'check_out'],
+                name='booking_room_status_dates_idx',
+            ),
+            # auto_complete_finished_bookings
+            models.Index(fields=['status', 'check_out'], name='booking_status_checkout_idx'),
+            # booking lists, keyset paginated on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created_idx'),
+            models.Index(fields=['provider', '-created_at', '-id'], name='booking_provider_created_idx'),
+            # upcoming check ins on the provider dashboard
+            models.Index(fields=['provider', 'check_in'], name='booking_provider_checkin_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking #{self.id} -> {self.user.full_name} -> {self.room}"
+
+
+class ArchivedRoomBooking(models.Model):
+    """
+    Cold copy of finished RoomBooking rows, moved here by the
+    archive_bookings command so the hot table and its indexes stay small.
+    Rows keep their RoomBooking id and timestamps.
+    """
+    id = models.BigIntegerField(primary_key=True)
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_room_bookings',
+    )
+
+    room_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    room_id = models.PositiveIntegerField()
+    room = GenericForeignKey('room_type', 'room_id')
+
+    provider = models.ForeignKey(
+        ProviderProfile,
+        on_delete=models.CASCADE,
+        related_name='archived_room_bookings'
+    )
+
+    check_in = models.DateField()
+    check_out = models.DateField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=RoomBooking.STATUS_CHOICE)
+
+    # copied from RoomBooking, not set on insert
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # history lists, keyset paginated on (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='archive_user_created_idx'),
+            models.Index(fields=['provider', '-created_at', '-id'], name='archive_provider_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking #{self.id} -> {self.room}"
+
+
+class RoomNight(models.Model):
+    """
+    Occupancy ledger, one row per (room type, room id, night) held by an
+    active booking. The night is the date the guest sleeps in the room,
+    so a booking from check_in to check_out claims [check_in, check_out).
+    """
+    booking = models.ForeignKey(
+        RoomBooking,
+        on_delete=models.CASCADE,
+        related_name='room_nights',
+    )
+    room_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    room_id = models.PositiveIntegerField()
+    night = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['room_type', 'room_id', 'night'],
+                name='unique_room_night',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['room_type', 'night', 'room_id'], name='room_night_type_night_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_type.model} #{self.room_id} -> {self.night}"
+
+
+class ProviderBookingRollup(models.Model):
+    """
+    Running per-provider booking totals for the dashboard.
+    Kept up to date by booking.services.record_status_changes in the same
+    transaction as every RoomBooking status change, repaired by the
+    rebuild_provider_rollups command.
+    """
+    provider = models.OneToOneField(
+        ProviderProfile,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='booking_rollup',
+    )
+
+    # plain integers, a drifted row must not fail a booking transaction
+    pending_count = models.IntegerField(default=0)
+    confirmed_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    rejected_count = models.IntegerField(default=0)
+
+    # total_price of CONFIRMED and COMPLETED bookings
+    revenue = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rollup -> {self.provider.display_name}"
+
+
+class BookingEvent(models.Model):
+    """
+    Append-only outbox of booking changes, one row per insert or status
+    change, written in the same transaction as the change. The id is the
+    feed cursor. Booking, guest and provider are plain ids, not foreign
+    keys, so events outlive the rows they describe.
+    """
+    EVENT_CHOICE = [
+        ('CREATED', 'Created'),
+        ('STATUS_CHANGED', 'Status changed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    event = models.CharField(max_length=20, choices=EVENT_CHOICE)
+
+    booking_id = models.PositiveBigIntegerField()
+    user_id = models.PositiveBigIntegerField()
+    provider_id = models.PositiveBigIntegerField()
+    room_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    room_id = models.PositiveIntegerField()
+    check_in = models.DateField()
+    check_out = models.DateField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    # old_status is blank for CREATED
+    old_status = models.CharField(max_length=20, choices=RoomBooking.STATUS_CHOICE, blank=True)
+    new_status = models.CharField(max_length=20, choices=RoomBooking.STATUS_CHOICE)
+
+    # PostgreSQL id of the writing transaction, 0 elsewhere, the feed reads
+    # in (transaction_id, id) order, see booking.services.get_booking_events
+    transaction_id = models.PositiveBigIntegerField(default=0, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['transaction_id', 'id'], name='bookingevent_feed_order'),
+        ]
+
     def __str__(self):
-        return f"Booking #{self.id} -> {self.user.full_name} -> {self.room}"
\ No newline at end of file
+        return f"Event #{self.id} -> booking #{self.booking_id} {self.old_status or '-'} -> {self.new_status}"
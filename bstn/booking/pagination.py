@@ -0,0 +1,100 @@
+import base64
+import heapq
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CreatedAtKeysetPagination(BasePagination):
+    """
+    Seek pagination for booking lists, newest first.
+
+    Rows are ordered by (created_at, id) descending and the cursor holds
+    the last pair the client saw, so the next page is a WHERE on that pair
+    plus LIMIT, served by the (..., -created_at, -id) indexes. Page 500
+    costs the same as page 1.
+
+    paginate_sources() pages several querysets (live and archived bookings)
+    as one list: each is seeked and limited on its own, then the pages are
+    merged.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_sources([queryset], request, view)
+
+    def paginate_sources(self, querysets, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        sources = []
+        for queryset in querysets:
+            queryset = queryset.order_by('-created_at', '-id')
+            if position:
+                created_at, last_id = position
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id)
+                )
+            # one extra row tells us whether another page exists
+            sources.append(list(queryset[:page_size + 1]))
+
+        rows = list(heapq.merge(*sources, key=lambda row: (row.created_at, row.id), reverse=True))
+        page = rows[:page_size]
+        self.next_position = None
+        if len(rows) > page_size:
+            self.next_position = (page[-1].created_at, page[-1].id)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError('page_size must be a number')
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.next_position:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(*self.next_position),
+        )
+
+    def encode_cursor(self, created_at, last_id):
+        # opaque to the client, it only hands it back
+        return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{last_id}'.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            created_at, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(last_id)
+        except (ValueError, UnicodeError):
+            raise ValidationError('Invalid cursor')
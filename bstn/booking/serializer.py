@@ -4,10 +4,37 @@ from datetime import date
 
 from accounts.models import User, ProviderProfile
 from listings import models
-from .models import RoomBooking
+from .models import BookingEvent, RoomBooking
+from listings.services import STAY_CONFIG
+from .services import booked_room_ids, effective_status, reserve_room, reserve_rooms, RoomUnavailable
 
 
-class RoomBookingSerializer(serializers.ModelSerializer):
+# map room_type string -> Model, converts string to model sent by user
+ROOM_MODEL_MAP = {
+    'hotel': models.HotelRoom,
+    'hotelroom': models.HotelRoom,
+    'resort': models.ResortRoom,
+    'resortroom': models.ResortRoom,
+    'homestay': models.HomeStayRoom,
+    'homestayroom': models.HomeStayRoom,
+}
+
+# largest BigAutoField id, bigger ids cannot reach the database
+MAX_ID = 2 ** 63 - 1
+
+# room model -> name of its parent stay field
+ROOM_STAY_ATTR = {cfg['room_model']: cfg['stay_attr'] for cfg in STAY_CONFIG.values()}
+
+
+class EffectiveStatusMixin:
+    # show ended CONFIRMED stays as COMPLETED before the sweeper gets to them
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['status'] = effective_status(instance.status, instance.check_out)
+        return data
+
+
+class RoomBookingSerializer(EffectiveStatusMixin, serializers.ModelSerializer):
     room_type_name = serializers.CharField(source='room_type.model', read_only=True)
     
     class Meta:
@@ -57,21 +84,11 @@ class RoomBookingCreateSerializer(serializers.ModelSerializer):
         check_in = data['check_in']
         check_out = data['check_out']
 
-        # map room_type string -> Model, converts string to model sent by user
-        room_model_map = {
-            'hotel': models.HotelRoom,
-            'hotelroom': models.HotelRoom,
-            'resort': models.ResortRoom,
-            'resortroom': models.ResortRoom,
-            'homestay': models.HomeStayRoom,
-            'homestayroom': models.HomeStayRoom,
-        }
-
-        if room_type not in room_model_map:
+        if room_type not in ROOM_MODEL_MAP:
             raise serializers.ValidationError('Invalid room type!')
         
         # pick the model based on type
-        model = room_model_map[room_type]
+        model = ROOM_MODEL_MAP[room_type]
 
         try:
             room_instance = model.objects.get(id=room_id)
@@ -90,14 +107,11 @@ class RoomBookingCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Check in cannot be past date!')
         
         # 3. Check overlapping bookings for this same room
-        existing_booking = RoomBooking.objects.filter(
-            room_type=ContentType.objects.get_for_model(room_instance),
-            room_id=room_instance.id,
-            status__in=['PENDING', 'CONFIRMED'],  # Only active bookings
-        ).filter(
-            check_in__lt=check_out,
-            check_out__gt=check_in,
-        )
+        existing_booking = booked_room_ids(
+            ContentType.objects.get_for_model(room_instance),
+            check_in,
+            check_out,
+        ).filter(room_id=room_instance.id)
 
         if existing_booking.exists():
             raise serializers.ValidationError('This room is already booked for the selected days!')
@@ -116,20 +130,165 @@ class RoomBookingCreateSerializer(serializers.ModelSerializer):
         # calculate the total price
         total_price = room.price_per_night * nights
 
-        # Create Booking
-        booking = RoomBooking.objects.create(
-            user=self.context['request'].user,
-            provider=provider,
-            room_type=ContentType.objects.get_for_model(room),
-            room_id=room.id,
-            check_in=validated_data['check_in'],
-            check_out=validated_data['check_out'],
-            total_price=total_price,
-        )
+        # Create Booking and claim its nights in one transaction
+        # validate() above is only a fast pre-check, the claim decides races
+        try:
+            booking = reserve_room(
+                self.context['request'].user,
+                room,
+                validated_data['check_in'],
+                validated_data['check_out'],
+                total_price,
+            )
+        except RoomUnavailable as e:
+            raise serializers.ValidationError(str(e))
 
         return booking
 
 
+class GroupRoomSerializer(serializers.Serializer):
+    room_type = serializers.CharField()
+    room_id = serializers.IntegerField()
+
+    def validate_room_type(self, value):
+        value = value.lower()
+        if value not in ROOM_MODEL_MAP:
+            raise serializers.ValidationError('Invalid room type!')
+        return value
+
+
+class GroupRoomBookingCreateSerializer(serializers.Serializer):
+    # Largest group a single request may book
+    MAX_ROOMS = 30
+
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    rooms = GroupRoomSerializer(many=True, allow_empty=False, max_length=MAX_ROOMS)
+
+    def validate(self, data):
+        """
+        Docstring for validate
+
+        Same date rules as a single booking, then per room type: one query
+        loads the rooms with their stay and provider, one query finds the
+        rooms already booked on these dates.
+        Problems are reported per room so the client can fix the group.
+        """
+        check_in = data['check_in']
+        check_out = data['check_out']
+
+        if check_out <= check_in:
+            raise serializers.ValidationError('Check out must be after check in!')
+        if check_in < date.today():
+            raise serializers.ValidationError('Check in cannot be past date!')
+
+        # room model -> requested ids, in request order
+        requested = {}
+        for ref in data['rooms']:
+            requested.setdefault(ROOM_MODEL_MAP[ref['room_type']], []).append(ref['room_id'])
+
+        found = {}
+        booked = set()
+        for model, ids in requested.items():
+            if len(set(ids)) != len(ids):
+                raise serializers.ValidationError('A room can only be booked once per group!')
+
+            stay_attr = ROOM_STAY_ATTR[model]
+            for room in model.objects.filter(id__in=ids).select_related(f'{stay_attr}__provider'):
+                found[(model, room.id)] = room
+
+            room_ct = ContentType.objects.get_for_model(model)
+            booked.update(
+                (model, room_id)
+                for room_id in booked_room_ids(room_ct, check_in, check_out).filter(room_id__in=ids)
+            )
+
+        results = []
+        for ref in data['rooms']:
+            key = (ROOM_MODEL_MAP[ref['room_type']], ref['room_id'])
+            if key not in found:
+                outcome = 'not found'
+            elif key in booked:
+                outcome = 'unavailable'
+            else:
+                outcome = 'ok'
+            results.append({**ref, 'result': outcome})
+
+        if any(result['result'] != 'ok' for result in results):
+            raise serializers.ValidationError({'rooms': results})
+
+        data['room_instances'] = [found[(ROOM_MODEL_MAP[ref['room_type']], ref['room_id'])] for ref in data['rooms']]
+        return data
+
+    def create(self, validated_data):
+        try:
+            return reserve_rooms(
+                self.context['request'].user,
+                validated_data['room_instances'],
+                validated_data['check_in'],
+                validated_data['check_out'],
+            )
+        except RoomUnavailable as e:
+            raise serializers.ValidationError(str(e))
+
+
+class BulkBookingTransitionSerializer(serializers.Serializer):
+    # Most bookings a single request may move
+    MAX_BOOKINGS = 500
+
+    # action -> status the pending bookings move to
+    ACTION_STATUS = {
+        'confirm': 'CONFIRMED',
+        'reject': 'REJECTED',
+    }
+
+    action = serializers.ChoiceField(choices=list(ACTION_STATUS))
+    booking_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID),
+        allow_empty=False,
+        max_length=MAX_BOOKINGS,
+    )
+
+
+class BookingExportSerializer(serializers.Serializer):
+    # query parameters of a booking export
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    provider = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ID)
+    status = serializers.ChoiceField(choices=RoomBooking.STATUS_CHOICE, required=False)
+    check_in_from = serializers.DateField(required=False)
+    check_in_to = serializers.DateField(required=False)
+
+
+class ProviderDashboardSerializer(serializers.Serializer):
+    provider = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    counts = serializers.DictField(child=serializers.IntegerField())
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    upcoming_check_ins = serializers.IntegerField()
+    next_check_ins = RoomBookingSerializer(many=True)
+
+
+class BookingEventSerializer(serializers.ModelSerializer):
+    room_type_name = serializers.CharField(source='room_type.model', read_only=True)
+
+    class Meta:
+        model = BookingEvent
+        fields = [
+            'id',
+            'event',
+            'booking_id',
+            'user_id',
+            'provider_id',
+            'room_type_name',
+            'room_id',
+            'check_in',
+            'check_out',
+            'total_price',
+            'old_status',
+            'new_status',
+            'created_at',
+        ]
+
+
 class GuestMiniSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -149,7 +308,7 @@ class ProviderMiniSerializer(serializers.ModelSerializer):
         ]
 
 
-class BookingDetailSerializer(serializers.ModelSerializer):
+class BookingDetailSerializer(EffectiveStatusMixin, serializers.ModelSerializer):
     guest = GuestMiniSerializer(source='user', read_only=True)
     provider = ProviderMiniSerializer(read_only=True)
     room = serializers.SerializerMethodField()
@@ -174,6 +333,8 @@ class BookingDetailSerializer(serializers.ModelSerializer):
         return (obj.check_out - obj.check_in).days
     
     def get_room(self, obj):
+        # list views load rooms through prefetch_booking_details,
+        # otherwise each booking costs a room and a stay query here
         room = obj.room 
         
         if room is None:
@@ -194,11 +355,13 @@ class BookingDetailSerializer(serializers.ModelSerializer):
             stay = None
 
         stay_data = None
-        if stay is None:
+        if stay is not None:
             stay_data = {
                 'id': stay.id,
                 'name': getattr(stay, 'name', ''),
                 'city': getattr(stay, 'city', ''),
+                'country': str(getattr(stay, 'country', '')),
+                # deprecated misspelling of country, kept while clients move over
                 'contry': str(getattr(stay, 'country', '')),
             }
         
@@ -1,12 +1,480 @@
 # booking/services.py
-from datetime import date
-from .models import RoomBooking
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.db import IntegrityError, connections, transaction
+from django.db.models import BooleanField, Count, F, PositiveBigIntegerField, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from accounts.models import ProviderProfile
+from listings.models import HotelRoom, ResortRoom, HomeStayRoom
+from listings.availability_index import availability_index, availability_index_enabled
+from listings.search_cache import invalidate_for_bookings
+from .models import ACTIVE_STATUSES, ArchivedRoomBooking, BookingEvent, ProviderBookingRollup, RoomBooking, RoomNight
 
+# Bookings that count towards a provider's revenue
+REVENUE_STATUSES = ['CONFIRMED', 'COMPLETED']
 
-def auto_complete_finished_bookings():
-    today = date.today()
-    # All CONFIRMED bookings whose stay has ended
-    RoomBooking.objects.filter(
-        status='CONFIRMED',
-        check_out__lt=today,
-    ).update(status='COMPLETED')
+# status -> ProviderBookingRollup counter field
+ROLLUP_COUNT_FIELDS = {status: f'{status.lower()}_count' for status, _ in RoomBooking.STATUS_CHOICE}
+
+
+def stay_nights(check_in, check_out):
+    # every night slept between check_in and check_out, check_out excluded
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+
+def uses_stay_range(using='default'):
+    # the stay_range column only exists on PostgreSQL, see migration 0005
+    return connections[using].vendor == 'postgresql'
+
+
+def overlapping_bookings(bookings, check_in, check_out):
+    """
+    Narrow a RoomBooking queryset to bookings overlapping [check_in, check_out).
+    On PostgreSQL this is stay_range && daterange(...), served by GiST.
+    """
+    if uses_stay_range(bookings.db):
+        return bookings.filter(RawSQL(
+            "stay_range && daterange(%s, %s, '[)')",
+            [check_in, check_out],
+            output_field=BooleanField(),
+        ))
+    return bookings.filter(check_in__lt=check_out, check_out__gt=check_in)
+
+
+def booked_room_ids(room_type, check_in, check_out):
+    """
+    room_id values of rooms of this content type with an active booking
+    in [check_in, check_out), as a lazy values_list queryset.
+    PostgreSQL answers from the stay_range index, other backends from
+    the RoomNight ledger.
+    """
+    if uses_stay_range():
+        active = RoomBooking.objects.filter(room_type=room_type, status__in=ACTIVE_STATUSES)
+        return overlapping_bookings(active, check_in, check_out).values_list('room_id', flat=True)
+
+    return RoomNight.objects.filter(
+        room_type=room_type,
+        night__gte=check_in,
+        night__lt=check_out,
+    ).values_list('room_id', flat=True)
+
+
+def occupy_room_nights(bookings, ignore_conflicts=False):
+    """
+    Write one ledger row per night of each booking.
+    Must run in the same transaction as the booking inserts.
+    """
+    RoomNight.objects.bulk_create(
+        [
+            RoomNight(
+                booking=booking,
+                room_type_id=booking.room_type_id,
+                room_id=booking.room_id,
+                night=night,
+            )
+            for booking in bookings
+            for night in stay_nights(booking.check_in, booking.check_out)
+        ],
+        ignore_conflicts=ignore_conflicts,
+    )
+
+    notify_availability_change(
+        [(booking.room_type_id, booking.room_id, booking.check_in, booking.check_out) for booking in bookings],
+        occupied=True,
+    )
+
+
+class RoomUnavailable(Exception):
+    pass
+
+
+def nights_claimed_by_others(rooms, check_in, check_out):
+    """
+    Whether another booking holds a night of one of these rooms in
+    [check_in, check_out). Asked after an IntegrityError rolled back, to
+    tell a lost race for the nights from any other constraint failure.
+    """
+    rooms_by_type = {}
+    for room in rooms:
+        rooms_by_type.setdefault(ContentType.objects.get_for_model(room), []).append(room.id)
+    return any(
+        booked_room_ids(room_type, check_in, check_out).filter(room_id__in=room_ids).exists()
+        for room_type, room_ids in rooms_by_type.items()
+    )
+
+
+def reserve_room(user, room, check_in, check_out, total_price):
+    """
+    Create a booking for one room and claim its nights in one transaction.
+
+    The unique (room_type, room_id, night) constraint on RoomNight is the
+    lock: of two overlapping requests only one can insert its nights, the
+    other gets an IntegrityError, its transaction rolls back and
+    RoomUnavailable is raised. Requests for different rooms claim
+    different rows and never wait on each other (on PostgreSQL the
+    stay_range exclusion constraint backs this up). Any other integrity
+    error is not about availability and propagates.
+    """
+    try:
+        with transaction.atomic():
+            booking = RoomBooking.objects.create(
+                user=user,
+                provider=room.provider,
+                room_type=ContentType.objects.get_for_model(room),
+                room_id=room.id,
+                check_in=check_in,
+                check_out=check_out,
+                total_price=total_price,
+            )
+            occupy_room_nights([booking])
+            record_status_changes([(booking.provider_id, None, booking.status, booking.total_price)])
+            record_booking_events([booking], None, booking.status)
+    except IntegrityError:
+        if nights_claimed_by_others([room], check_in, check_out):
+            raise RoomUnavailable('This room is already booked for the selected days!')
+        raise
+    return booking
+
+
+def reserve_rooms(user, rooms, check_in, check_out):
+    """
+    Book several rooms for the same dates, all or nothing.
+
+    Every booking is inserted with one bulk_create and every night with
+    another, inside one transaction. If any night is already claimed the
+    whole group rolls back and RoomUnavailable is raised, other integrity
+    errors propagate.
+    rooms must have their parent stay and provider loaded.
+    """
+    nights = (check_out - check_in).days
+    try:
+        with transaction.atomic():
+            bookings = RoomBooking.objects.bulk_create([
+                RoomBooking(
+                    user=user,
+                    provider=room.provider,
+                    room_type=ContentType.objects.get_for_model(room),
+                    room_id=room.id,
+                    check_in=check_in,
+                    check_out=check_out,
+                    total_price=room.price_per_night * nights,
+                )
+                for room in rooms
+            ])
+            occupy_room_nights(bookings)
+            record_status_changes([
+                (booking.provider_id, None, booking.status, booking.total_price)
+                for booking in bookings
+            ])
+            record_booking_events(bookings, None, 'PENDING')
+    except IntegrityError:
+        if nights_claimed_by_others(rooms, check_in, check_out):
+            raise RoomUnavailable('Some rooms are already booked for the selected days!')
+        raise
+    return bookings
+
+
+def release_room_nights(bookings):
+    # bookings can be a list of ids or a RoomBooking queryset
+    released = list(RoomBooking.objects.filter(id__in=bookings).values_list(
+        'room_type_id', 'room_id', 'check_in', 'check_out',
+    ))
+    RoomNight.objects.filter(booking__in=bookings).delete()
+    notify_availability_change(released, occupied=False)
+
+
+def notify_availability_change(rows, occupied):
+    """
+    Let in-process readers of availability catch up once the transaction
+    commits: patch the bitmap index and evict overlapping cached searches.
+    rows are (room_type_id, room_id, check_in, check_out) tuples.
+    """
+    def notify():
+        if availability_index_enabled():
+            patch = availability_index.occupy if occupied else availability_index.release
+            for row in rows:
+                patch(*row)
+        invalidate_for_bookings(rows)
+
+    transaction.on_commit(notify)
+
+
+def prefetch_booking_details(bookings):
+    """
+    Load what BookingDetailSerializer reads for a RoomBooking queryset:
+    guest and provider by join, rooms with their parent stay in one query
+    per room model. A page of bookings then costs a fixed number of queries.
+    """
+    return bookings.select_related('user', 'provider').prefetch_related(
+        GenericPrefetch('room', [
+            HotelRoom.objects.select_related('hotel'),
+            ResortRoom.objects.select_related('resort'),
+            HomeStayRoom.objects.select_related('homestay'),
+        ]),
+    )
+
+
+def record_status_changes(changes):
+    """
+    Apply booking status changes to the provider rollups.
+
+    changes are (provider_id, old_status, new_status, total_price) tuples,
+    old_status is None for a new booking. Must run in the same transaction
+    as the RoomBooking writes. Costs one insert plus one UPDATE per
+    provider touched, whatever the number of changes.
+    """
+    deltas = {}
+    for provider_id, old_status, new_status, total_price in changes:
+        delta = deltas.setdefault(provider_id, {'revenue': Decimal('0.00')})
+        if old_status:
+            field = ROLLUP_COUNT_FIELDS[old_status]
+            delta[field] = delta.get(field, 0) - 1
+            if old_status in REVENUE_STATUSES:
+                delta['revenue'] -= total_price
+        field = ROLLUP_COUNT_FIELDS[new_status]
+        delta[field] = delta.get(field, 0) + 1
+        if new_status in REVENUE_STATUSES:
+            delta['revenue'] += total_price
+
+    if not deltas:
+        return
+    ProviderBookingRollup.objects.bulk_create(
+        [ProviderBookingRollup(provider_id=provider_id) for provider_id in deltas],
+        ignore_conflicts=True,
+    )
+    for provider_id, delta in deltas.items():
+        ProviderBookingRollup.objects.filter(provider_id=provider_id).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + amount for field, amount in delta.items() if amount},
+        )
+
+
+def record_booking_events(bookings, old_status, new_status):
+    """
+    Append one outbox row per booking with a single insert.
+    bookings are RoomBooking instances or state machine BookingRows,
+    old_status is None for new bookings. Must run in the same
+    transaction as the RoomBooking writes.
+    """
+    transaction_id = current_transaction_id()
+    BookingEvent.objects.bulk_create([
+        BookingEvent(
+            event='STATUS_CHANGED' if old_status else 'CREATED',
+            booking_id=booking.id,
+            user_id=booking.user_id,
+            provider_id=booking.provider_id,
+            room_type_id=booking.room_type_id,
+            room_id=booking.room_id,
+            check_in=booking.check_in,
+            check_out=booking.check_out,
+            total_price=booking.total_price,
+            old_status=old_status or '',
+            new_status=new_status,
+            transaction_id=transaction_id,
+        )
+        for booking in bookings
+    ])
+
+
+def current_transaction_id(using='default'):
+    # PostgreSQL id of the running transaction, 0 elsewhere: SQLite has
+    # one writer at a time, so its event ids already commit in order
+    if connections[using].vendor != 'postgresql':
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_current_xact_id()::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def transaction_horizon(using='default'):
+    """
+    PostgreSQL only: (xmin, own) where every transaction below xmin has
+    committed or rolled back and own is the reading transaction, if it
+    has written anything. None elsewhere.
+    """
+    if connections[using].vendor != 'postgresql':
+        return None
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, '
+            'pg_current_xact_id_if_assigned()::text::bigint'
+        )
+        return cursor.fetchone()
+
+
+def get_booking_events(since=0, limit=500):
+    """
+    Up to limit outbox rows after the event since, in (transaction_id, id)
+    order. Returns (events, has_more).
+
+    PostgreSQL hands out ids before commit, so a later id can become
+    visible first and an id cursor would skip the earlier one for good.
+    Instead only events of finished transactions (transaction_id below the
+    snapshot xmin) are read, and every transaction that finishes later has
+    a transaction_id at or above that horizon, so it sorts after anything
+    already read. On SQLite transaction_id is 0 and this is id order.
+    """
+    events = BookingEvent.objects.select_related('room_type').order_by('transaction_id', 'id')
+    if since:
+        after = Coalesce(
+            Subquery(BookingEvent.objects.filter(id=since).values('transaction_id')),
+            0,
+            output_field=PositiveBigIntegerField(),
+        )
+        events = events.filter(Q(transaction_id__gt=after) | Q(transaction_id=after, id__gt=since))
+    horizon = transaction_horizon(events.db)
+    if horizon is not None:
+        xmin, own = horizon
+        events = events.filter(Q(transaction_id__lt=xmin) | Q(transaction_id=own))
+    events = list(events[:limit + 1])
+    return events[:limit], len(events) > limit
+
+
+def rollup_totals(provider_ids):
+    # provider_id -> rollup field values, aggregated from live and archived bookings
+    counts = {
+        field: Count('id', filter=Q(status=status))
+        for status, field in ROLLUP_COUNT_FIELDS.items()
+    }
+    totals = {}
+    for model in (RoomBooking, ArchivedRoomBooking):
+        rows = model.objects.filter(provider_id__in=provider_ids).values('provider_id').annotate(
+            revenue=Sum('total_price', filter=Q(status__in=REVENUE_STATUSES), default=Decimal('0.00')),
+            **counts,
+        ).order_by()
+        for row in rows:
+            total = totals.setdefault(row.pop('provider_id'), {})
+            for field, value in row.items():
+                total[field] = total.get(field, 0) + value
+    return totals
+
+
+def rebuild_provider_rollups(provider_ids=None, batch_size=500):
+    """
+    Recompute provider rollups from RoomBooking, batch_size providers per
+    transaction. The rollup rows are locked before the bookings are
+    aggregated, so a concurrent status change either lands in the
+    aggregate or applies its delta after the rebuild commits.
+    Returns the number of rollups that had drifted.
+    """
+    providers = ProviderProfile.objects.order_by('id')
+    if provider_ids is not None:
+        providers = providers.filter(id__in=provider_ids)
+    provider_ids = list(providers.values_list('id', flat=True))
+    fields = list(ROLLUP_COUNT_FIELDS.values()) + ['revenue']
+
+    repaired = 0
+    for start in range(0, len(provider_ids), batch_size):
+        chunk = provider_ids[start:start + batch_size]
+        with transaction.atomic():
+            ProviderBookingRollup.objects.bulk_create(
+                [ProviderBookingRollup(provider_id=provider_id) for provider_id in chunk],
+                ignore_conflicts=True,
+            )
+            rollups = list(ProviderBookingRollup.objects.select_for_update().filter(provider_id__in=chunk))
+            totals = rollup_totals(chunk)
+
+            drifted = []
+            for rollup in rollups:
+                expected = totals.get(rollup.provider_id, {})
+                values = {field: expected.get(field, 0) for field in fields}
+                if any(getattr(rollup, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(rollup, field, value)
+                    rollup.updated_at = timezone.now()
+                    drifted.append(rollup)
+            ProviderBookingRollup.objects.bulk_update(drifted, fields + ['updated_at'])
+            repaired += len(drifted)
+    return repaired
+
+
+def get_provider_dashboard(provider, today=None, upcoming_limit=5):
+    """
+    Dashboard numbers for one provider: status counts and revenue from the
+    rollup row, upcoming check ins from the (provider, check_in) index.
+    Neither depends on how many past bookings the provider has.
+    """
+    today = today or date.today()
+    rollup = ProviderBookingRollup.objects.filter(provider=provider).first()
+    upcoming = RoomBooking.objects.filter(
+        provider=provider,
+        status__in=ACTIVE_STATUSES,
+        check_in__gte=today,
+    )
+    return {
+        'provider': provider.id,
+        'counts': {
+            status: getattr(rollup, field, 0)
+            for status, field in ROLLUP_COUNT_FIELDS.items()
+        },
+        'revenue': rollup.revenue if rollup else Decimal('0.00'),
+        'upcoming_check_ins': upcoming.count(),
+        'next_check_ins': upcoming.select_related('room_type').order_by('check_in', 'id')[:upcoming_limit],
+    }
+
+
+def effective_status(status, check_out, today=None):
+    # a CONFIRMED stay that has ended reads as COMPLETED until the sweeper runs
+    if status == 'CONFIRMED' and check_out < (today or date.today()):
+        return 'COMPLETED'
+    return status
+
+
+def backfill_room_nights(batch_size=1000):
+    """
+    Write ledger rows for every active booking, skipping nights that are
+    already claimed. Returns the number of bookings visited.
+    """
+    bookings = RoomBooking.objects.filter(status__in=ACTIVE_STATUSES).order_by('id')
+    visited = 0
+    batch = []
+    for booking in bookings.iterator(chunk_size=batch_size):
+        batch.append(booking)
+        if len(batch) == batch_size:
+            with transaction.atomic():
+                occupy_room_nights(batch, ignore_conflicts=True)
+            visited += len(batch)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            occupy_room_nights(batch, ignore_conflicts=True)
+        visited += len(batch)
+    return visited
+
+
+def check_room_night_ledger():
+    """
+    Compare the occupancy ledger against RoomBooking.
+
+    Returns a dict with:
+        missing: ids of active bookings that do not own all their nights
+        stale: ids of ledger rows that no active booking accounts for
+    """
+    stale = RoomNight.objects.filter(
+        ~Q(booking__status__in=ACTIVE_STATUSES)
+        | ~Q(room_type=F('booking__room_type'))
+        | ~Q(room_id=F('booking__room_id'))
+        | Q(night__lt=F('booking__check_in'))
+        | Q(night__gte=F('booking__check_out'))
+    ).values_list('id', flat=True)
+
+    active = RoomBooking.objects.filter(
+        status__in=ACTIVE_STATUSES,
+    ).annotate(
+        night_count=Count('room_nights'),
+    ).values_list('id', 'check_in', 'check_out', 'night_count')
+
+    missing = [
+        booking_id
+        for booking_id, check_in, check_out, night_count in active.iterator()
+        if night_count != (check_out - check_in).days
+    ]
+
+    return {
+        'missing': missing,
+        'stale': list(stale),
+    }
@@ -0,0 +1,191 @@
+# booking/state_machine.py
+"""
+Every RoomBooking status change goes through here.
+
+A transition is a compare-and-swap: one UPDATE that sets only status and
+updated_at WHERE the row still has the status the caller observed. If
+another request moved the booking first the UPDATE matches nothing and
+the transition reports that it lost, so two actions on one booking can
+never both succeed. The ledger, provider rollup, change feed and
+availability caches catch up in the same transaction as the winning
+UPDATE.
+"""
+from collections import namedtuple
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RoomBooking
+from .services import (
+    ACTIVE_STATUSES,
+    notify_availability_change,
+    record_booking_events,
+    record_status_changes,
+    release_room_nights,
+)
+
+# new status -> statuses a booking may move to it from
+TRANSITIONS = {
+    'CONFIRMED': ['PENDING'],
+    'REJECTED': ['PENDING'],
+    'CANCELLED': ['PENDING', 'CONFIRMED'],
+    'COMPLETED': ['CONFIRMED'],
+}
+
+# what the side effects of a transition need to know about a booking
+BookingRow = namedtuple(
+    'BookingRow',
+    ['id', 'user_id', 'provider_id', 'status', 'total_price', 'room_type_id', 'room_id', 'check_in', 'check_out'],
+)
+
+
+def can_transition(old_status, new_status):
+    return old_status in TRANSITIONS.get(new_status, ())
+
+
+def locked_rows(bookings):
+    # BookingRow for each booking of the queryset, row locked until commit
+    return [
+        BookingRow(*row)
+        for row in bookings.select_for_update().values_list(*BookingRow._fields)
+    ]
+
+
+def transition(booking, new_status, **conditions):
+    """
+    Move one booking from the status it was loaded with to new_status.
+
+    conditions are extra filters the row must still satisfy, e.g.
+    provider=... or check_in__gt=today. Returns True when this call won;
+    the instance then carries the new status. Returns False when the
+    transition is not allowed or the row changed underneath us.
+    """
+    old_status = booking.status
+    if not can_transition(old_status, new_status):
+        return False
+
+    now = timezone.now()
+    with transaction.atomic():
+        won = RoomBooking.objects.filter(id=booking.id, status=old_status, **conditions).update(
+            status=new_status,
+            updated_at=now,
+        )
+        if not won:
+            return False
+        after_transition(
+            [BookingRow(*(getattr(booking, field) for field in BookingRow._fields))],
+            old_status,
+            new_status,
+        )
+
+    booking.status = new_status
+    booking.updated_at = now
+    return True
+
+
+def transition_many(rows, old_status, new_status, **conditions):
+    """
+    Move many bookings from old_status to new_status with one UPDATE.
+    rows are BookingRow tuples from locked_rows, taken in the caller's
+    transaction, so every one of them is still in old_status.
+    Returns the number of bookings moved.
+    """
+    if not rows:
+        return 0
+    if not can_transition(old_status, new_status):
+        raise ValueError(f'{old_status} bookings cannot become {new_status}.')
+
+    moved = RoomBooking.objects.filter(
+        id__in=[row.id for row in rows],
+        status=old_status,
+        **conditions,
+    ).update(status=new_status, updated_at=timezone.now())
+    after_transition(rows, old_status, new_status)
+    return moved
+
+
+def after_transition(rows, old_status, new_status):
+    record_status_changes([
+        (row.provider_id, old_status, new_status, row.total_price) for row in rows
+    ])
+    record_booking_events(rows, old_status, new_status)
+    if old_status in ACTIVE_STATUSES and new_status not in ACTIVE_STATUSES:
+        # hand the nights back to the ledger
+        release_room_nights([row.id for row in rows])
+    elif new_status in ACTIVE_STATUSES:
+        # still occupied, but cached searches of these dates are stale
+        notify_availability_change(
+            [(row.room_type_id, row.room_id, row.check_in, row.check_out) for row in rows],
+            occupied=True,
+        )
+
+
+def bulk_transition_pending(provider, booking_ids, new_status):
+    """
+    Move many PENDING bookings of one provider to CONFIRMED or REJECTED.
+
+    One locking read classifies the ids, one conditional UPDATE scoped to
+    provider and status='PENDING' applies the change.
+    Returns {booking id: 'applied' | 'not found' | 'not owned' | 'wrong status'}.
+    """
+    booking_ids = list(dict.fromkeys(booking_ids))
+    with transaction.atomic():
+        rows = {row.id: row for row in locked_rows(RoomBooking.objects.filter(id__in=booking_ids))}
+
+        outcomes = {}
+        for booking_id in booking_ids:
+            row = rows.get(booking_id)
+            if row is None:
+                outcomes[booking_id] = 'not found'
+            elif row.provider_id != provider.id:
+                outcomes[booking_id] = 'not owned'
+            elif row.status != 'PENDING':
+                outcomes[booking_id] = 'wrong status'
+            else:
+                outcomes[booking_id] = 'applied'
+
+        transition_many(
+            [rows[booking_id] for booking_id, outcome in outcomes.items() if outcome == 'applied'],
+            'PENDING',
+            new_status,
+            provider=provider,
+        )
+    return outcomes
+
+
+def auto_complete_finished_bookings(batch_size=1000, today=None):
+    """
+    Mark CONFIRMED bookings whose stay has ended as COMPLETED.
+
+    Works in batches of batch_size rows, each in its own short transaction,
+    walking (check_out, id) upwards from a watermark so every batch is a
+    range scan on the (status, check_out) index. Returns the number of
+    bookings completed.
+    """
+    today = today or date.today()
+    touched = 0
+    watermark = None
+
+    while True:
+        # All CONFIRMED bookings whose stay has ended, past the watermark
+        finished = RoomBooking.objects.filter(status='CONFIRMED', check_out__lt=today)
+        if watermark:
+            last_check_out, last_id = watermark
+            finished = finished.filter(
+                Q(check_out__gt=last_check_out) | Q(check_out=last_check_out, id__gt=last_id)
+            )
+        batch = list(finished.order_by('check_out', 'id').values_list('id', 'check_out')[:batch_size])
+        if not batch:
+            return touched
+
+        with transaction.atomic():
+            # re-read under lock, a booking may have moved on since the scan
+            rows = locked_rows(RoomBooking.objects.filter(
+                id__in=[booking_id for booking_id, _ in batch],
+                status='CONFIRMED',
+            ))
+            touched += transition_many(rows, 'CONFIRMED', 'COMPLETED')
+        last_id, last_check_out = batch[-1]
+        watermark = (last_check_out, last_id)
@@ -1,3 +1,905 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+import csv
+import json
+import threading
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import User, ProviderProfile
+from listings.models import Hotel, HotelRoom, Resort, ResortRoom, HomeStay, HomeStayRoom
+from listings.search_cache import search_cache
+from .api_views import MyRoomBookingsAPIView, ProviderBookingsAPIView
+from .archive import archive_finished_bookings
+from .models import ArchivedRoomBooking, BookingEvent, ProviderBookingRollup, RoomBooking, RoomNight
+from .pagination import CreatedAtKeysetPagination
+from .services import (
+    booked_room_ids,
+    check_room_night_ledger,
+    occupy_room_nights,
+    rebuild_provider_rollups,
+    reserve_room,
+    reserve_rooms,
+    RoomUnavailable,
+)
+from .state_machine import auto_complete_finished_bookings, transition
+
+
+class BookingTestMixin:
+    # small fixture builders shared by booking tests
+
+    def make_user(self, username, phone):
+        return User.objects.create_user(
+            username=username,
+            password='pass12345',
+            phone=phone,
+            full_name=username.title(),
+        )
+
+    def make_provider(self, user):
+        return ProviderProfile.objects.create(
+            user=user,
+            display_name=f'{user.username} stays',
+            business_type='INDIVIDUAL',
+            description='',
+            country='BD',
+            city='Dhaka',
+            address='Road 1',
+            phone=user.phone,
+        )
+
+    def make_hotel(self, provider, city='Dhaka'):
+        return Hotel.objects.create(
+            provider=provider,
+            name='Test Hotel',
+            total_rooms=10,
+            check_in_time=time(14),
+            check_out_time=time(11),
+            address='Road 1',
+            city=city,
+            country='BD',
+        )
+
+    def make_hotel_room(self, hotel, price=100):
+        return HotelRoom.objects.create(
+            hotel=hotel,
+            room_name='Room',
+            max_guest_per_room=2,
+            price_per_night=price,
+            room_type='DOUBLE',
+        )
+
+    def setUp(self):
+        # cached searches outlive the test database between tests
+        search_cache().clear()
+        self.guest = self.make_user('guest', '0100')
+        self.host = self.make_user('host', '0200')
+        self.provider = self.make_provider(self.host)
+        self.hotel = self.make_hotel(self.provider)
+        self.room = self.make_hotel_room(self.hotel)
+        self.client = APIClient()
+
+    def book(self, check_in, check_out, room=None, user=None):
+        self.client.force_authenticate(user or self.guest)
+        return self.client.post(reverse('room-booking-create'), {
+            'room_type': 'hotel',
+            'room_id': (room or self.room).id,
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+        }, format='json')
+
+
+class RoomNightLedgerTests(BookingTestMixin, TestCase):
+
+    def test_booking_claims_each_night(self):
+        check_in = date.today() + timedelta(days=3)
+        response = self.book(check_in, check_in + timedelta(days=2))
+
+        self.assertEqual(response.status_code, 201)
+        nights = RoomNight.objects.filter(booking_id=response.data['id'])
+        self.assertEqual(
+            sorted(nights.values_list('night', flat=True)),
+            [check_in, check_in + timedelta(days=1)],
+        )
+
+    def test_overlapping_booking_is_rejected(self):
+        check_in = date.today() + timedelta(days=3)
+        self.book(check_in, check_in + timedelta(days=3))
+
+        response = self.book(check_in + timedelta(days=2), check_in + timedelta(days=4))
+        self.assertEqual(response.status_code, 400)
+
+        # back to back stays share no night
+        response = self.book(check_in + timedelta(days=3), check_in + timedelta(days=4))
+        self.assertEqual(response.status_code, 201)
+
+    def test_cancel_releases_nights(self):
+        check_in = date.today() + timedelta(days=3)
+        booking_id = self.book(check_in, check_in + timedelta(days=2)).data['id']
+
+        response = self.client.post(reverse('cancel-room-booking', args=[booking_id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(RoomNight.objects.filter(booking_id=booking_id).exists())
+        self.assertEqual(self.book(check_in, check_in + timedelta(days=2)).status_code, 201)
+
+    def test_backfill_and_checker(self):
+        check_in = date.today() + timedelta(days=3)
+        booking = RoomBooking.objects.create(
+            user=self.guest,
+            provider=self.provider,
+            room=self.room,
+            check_in=check_in,
+            check_out=check_in + timedelta(days=2),
+        )
+        self.assertEqual(check_room_night_ledger()['missing'], [booking.id])
+
+        call_command('backfill_room_nights', stdout=StringIO())
+
+        self.assertEqual(check_room_night_ledger(), {'missing': [], 'stale': []})
+        self.assertEqual(RoomNight.objects.filter(booking=booking).count(), 2)
+
+
+class ReserveRoomTests(BookingTestMixin, TestCase):
+
+    def test_claim_decides_when_the_pre_check_misses(self):
+        check_in = date.today() + timedelta(days=3)
+        self.book(check_in, check_in + timedelta(days=2))
+
+        # as if both requests passed validate() before either inserted
+        with patch('booking.serializer.booked_room_ids', return_value=RoomNight.objects.none()):
+            response = self.book(check_in + timedelta(days=1), check_in + timedelta(days=3))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RoomBooking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 2)
+
+    def test_failed_claim_leaves_nothing_behind(self):
+        check_in = date.today() + timedelta(days=3)
+        reserve_room(self.guest, self.room, check_in, check_in + timedelta(days=2), 200)
+
+        with self.assertRaises(RoomUnavailable):
+            reserve_room(self.guest, self.room, check_in + timedelta(days=1), check_in + timedelta(days=2), 100)
+
+        self.assertEqual(RoomBooking.objects.count(), 1)
+
+    def test_other_integrity_errors_are_not_reported_as_booked(self):
+        check_in = date.today() + timedelta(days=3)
+        failure = IntegrityError('NOT NULL constraint failed: booking_bookingevent.new_status')
+        with patch('booking.services.record_booking_events', side_effect=failure):
+            with self.assertRaises(IntegrityError):
+                reserve_room(self.guest, self.room, check_in, check_in + timedelta(days=2), 200)
+            with self.assertRaises(IntegrityError):
+                reserve_rooms(self.guest, [self.room], check_in, check_in + timedelta(days=2))
+
+        self.assertEqual(RoomBooking.objects.count(), 0)
+        self.assertEqual(RoomNight.objects.count(), 0)
+
+
+class ConcurrentReserveRoomTests(BookingTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        # checked here, the test database only exists once tests run
+        # settings give SQLite a file TEST NAME, this guards against overrides
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('threads cannot share an in-memory SQLite test database')
+        super().setUp()
+
+    def test_concurrent_requests_for_one_room_book_it_once(self):
+        check_in = date.today() + timedelta(days=3)
+        start_line = threading.Barrier(8)
+        outcomes = []
+
+        def attempt():
+            start_line.wait()
+            try:
+                reserve_room(self.guest, self.room, check_in, check_in + timedelta(days=2), 200)
+                outcomes.append('booked')
+            except RoomUnavailable:
+                outcomes.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(RoomBooking.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'stay_range only exists on PostgreSQL')
+class PostgresStayRangeTests(BookingTestMixin, TestCase):
+    # run with BSTN_DB_ENGINE=postgresql against a throwaway database
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=3)
+        self.booking = RoomBooking.objects.create(
+            user=self.guest,
+            provider=self.provider,
+            room=self.room,
+            check_in=self.check_in,
+            check_out=self.check_in + timedelta(days=3),
+        )
+
+    def overlapping(self, status='PENDING', days=(1, 2)):
+        return RoomBooking(
+            user=self.guest,
+            provider=self.provider,
+            room=self.room,
+            check_in=self.check_in + timedelta(days=days[0]),
+            check_out=self.check_in + timedelta(days=days[1]),
+            status=status,
+        )
+
+    def test_exclusion_constraint_rejects_overlap(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.overlapping().save()
+
+    def test_inactive_and_adjacent_bookings_are_allowed(self):
+        self.overlapping(status='CANCELLED').save()
+        self.overlapping(days=(3, 5)).save()
+
+    def test_overlap_search_uses_stay_range(self):
+        room_ct = ContentType.objects.get_for_model(HotelRoom)
+        booked = booked_room_ids(room_ct, self.check_in + timedelta(days=2), self.check_in + timedelta(days=4))
+
+        self.assertIn('stay_range &&', str(booked.query))
+        self.assertEqual(list(booked), [self.room.id])
+        self.assertEqual(
+            list(booked_room_ids(room_ct, self.check_in + timedelta(days=3), self.check_in + timedelta(days=4))),
+            [],
+        )
+
+    def test_race_surfaces_as_validation_error(self):
+        # validate() misses the booking, as if it committed right after the check
+        with patch('booking.serializer.booked_room_ids', return_value=RoomNight.objects.none()):
+            response = self.book(self.check_in, self.check_in + timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+
+
+class CompleteBookingsSweeperTests(BookingTestMixin, TestCase):
+
+    def make_booking(self, check_out, status='CONFIRMED'):
+        # a room per booking keeps the ledger free of clashes
+        booking = RoomBooking.objects.create(
+            user=self.guest,
+            provider=self.provider,
+            room=self.make_hotel_room(self.hotel),
+            check_in=check_out - timedelta(days=1),
+            check_out=check_out,
+            status=status,
+        )
+        occupy_room_nights([booking])
+        return booking
+
+    def test_sweeper_completes_finished_stays_in_batches(self):
+        today = date.today()
+        finished = [self.make_booking(today - timedelta(days=i)) for i in (1, 1, 3)]
+        ongoing = self.make_booking(today)
+        pending = self.make_booking(today - timedelta(days=2), status='PENDING')
+
+        out = StringIO()
+        call_command('complete_bookings', batch_size=1, stdout=out)
+
+        self.assertIn('completed 3 bookings', out.getvalue())
+        self.assertEqual(
+            set(RoomBooking.objects.filter(status='COMPLETED').values_list('id', flat=True)),
+            {booking.id for booking in finished},
+        )
+        self.assertFalse(RoomNight.objects.filter(booking__in=finished).exists())
+        self.assertEqual(RoomBooking.objects.get(id=ongoing.id).status, 'CONFIRMED')
+        self.assertEqual(RoomBooking.objects.get(id=pending.id).status, 'PENDING')
+
+    def test_list_is_a_pure_read_that_shows_completion(self):
+        booking = self.make_booking(date.today() - timedelta(days=1))
+        self.client.force_authenticate(self.guest)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my-room-bookings'))
+
+        self.assertEqual(response.data['results'][0]['status'], 'COMPLETED')
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in queries))
+        self.assertEqual(RoomBooking.objects.get(id=booking.id).status, 'CONFIRMED')
+
+
+class GroupRoomBookingTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rooms = [self.room] + [self.make_hotel_room(self.hotel, price=50) for _ in range(4)]
+        self.check_in = date.today() + timedelta(days=3)
+        self.client.force_authenticate(self.guest)
+
+    def post(self, rooms, nights=2):
+        return self.client.post(reverse('group-room-booking-create'), {
+            'check_in': self.check_in.isoformat(),
+            'check_out': (self.check_in + timedelta(days=nights)).isoformat(),
+            'rooms': [{'room_type': 'hotel', 'room_id': room_id} for room_id in rooms],
+        }, format='json')
+
+    def test_books_every_room_with_a_combined_total(self):
+        response = self.post([room.id for room in self.rooms])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '600.00')  # (100 + 4 * 50) * 2 nights
+        self.assertEqual(len(response.data['bookings']), 5)
+        self.assertEqual(RoomNight.objects.count(), 10)
+
+    def test_one_taken_room_books_nothing(self):
+        self.book(self.check_in + timedelta(days=1), self.check_in + timedelta(days=2), room=self.rooms[2])
+
+        response = self.post([room.id for room in self.rooms] + [999])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [room['result'] for room in response.data['rooms']],
+            ['ok', 'ok', 'unavailable', 'ok', 'ok', 'not found'],
+        )
+        self.assertEqual(RoomBooking.objects.count(), 1)
+
+    def test_race_rolls_back_the_whole_group(self):
+        self.book(self.check_in, self.check_in + timedelta(days=1), room=self.rooms[3])
+
+        with patch('booking.serializer.booked_room_ids', return_value=RoomNight.objects.none()):
+            response = self.post([room.id for room in self.rooms])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RoomBooking.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_group_size(self):
+        self.post([self.rooms[0].id], nights=1)  # warm the ContentType cache
+        RoomBooking.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as one_room:
+            self.post([self.rooms[0].id])
+        RoomBooking.objects.all().delete()
+        with CaptureQueriesContext(connection) as five_rooms:
+            self.post([room.id for room in self.rooms])
+
+        self.assertEqual(len(one_room), len(five_rooms))
+
+
+class BookingDetailQueryCountTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        stay_fields = {
+            'provider': self.provider,
+            'total_rooms': 1,
+            'check_in_time': time(14),
+            'check_out_time': time(11),
+            'address': 'Road 1',
+            'city': 'Dhaka',
+            'country': 'BD',
+        }
+        resort = Resort.objects.create(name='Test Resort', **stay_fields)
+        homestay = HomeStay.objects.create(name='Test Home', **stay_fields)
+        self.rooms = [
+            self.room,
+            ResortRoom.objects.create(resort=resort, max_guest_per_room=2, price_per_night=300),
+            HomeStayRoom.objects.create(homestay=homestay, max_guest_per_room=2, price_per_night=40),
+        ]
+        self.client.force_authenticate(self.guest)
+
+    def make_bookings(self, count):
+        RoomBooking.objects.all().delete()
+        check_in = date.today() + timedelta(days=3)
+        RoomBooking.objects.bulk_create([
+            RoomBooking(
+                user=self.guest,
+                provider=self.provider,
+                room=self.rooms[i % 3],
+                check_in=check_in,
+                check_out=check_in + timedelta(days=1),
+            )
+            for i in range(count)
+        ])
+
+    def test_my_bookings_cost_a_fixed_number_of_queries(self):
+        for count in (10, 100, 1000):
+            with self.subTest(count=count):
+                self.make_bookings(count)
+                # live bookings, archived bookings, one query per room model with its stay joined
+                with self.assertNumQueries(5):
+                    response = self.client.get(reverse('my-room-bookings'), {'page_size': 100})
+                self.assertEqual(len(response.data['results']), min(count, 100))
+
+    def test_room_and_stay_are_serialized(self):
+        self.make_bookings(3)
+        response = self.client.get(reverse('my-room-bookings'))
+
+        rooms = {booking['room']['type']: booking['room'] for booking in response.data['results']}
+        self.assertEqual(set(rooms), {'hotel', 'resort', 'homestay'})
+        self.assertEqual(rooms['resort']['stay']['name'], 'Test Resort')
+        self.assertEqual(rooms['hotel']['stay']['country'], 'BD')
+        self.assertEqual(rooms['hotel']['stay']['contry'], 'BD')  # deprecated alias
+        self.assertEqual(response.data['results'][0]['guest']['id'], self.guest.id)
+
+
+class KeysetPaginationTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        check_in = date.today() + timedelta(days=3)
+        RoomBooking.objects.bulk_create([
+            RoomBooking(
+                user=self.guest,
+                provider=self.provider,
+                room=self.room,
+                check_in=check_in,
+                check_out=check_in + timedelta(days=1),
+            )
+            for _ in range(25)
+        ])
+        self.client.force_authenticate(self.host)
+        self.url = reverse('Provider-room-bookings-list', args=[self.provider.id])
+
+    def test_pages_walk_newest_first_without_repeats(self):
+        seen = []
+        response = self.client.get(self.url, {'page_size': 10})
+        while True:
+            seen += [booking['id'] for booking in response.data['results']]
+            if not response.data['next']:
+                break
+            # every page, however deep, costs the same three queries: the
+            # IsProvider check plus one seek each on live and archived bookings
+            with self.assertNumQueries(3):
+                response = self.client.get(response.data['next'])
+
+        expected = list(RoomBooking.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(CreatedAtKeysetPagination.max_page_size, 100)
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'x'}).status_code, 400)
+
+
+class ProviderBookingRollupTests(BookingTestMixin, TestCase):
+
+    def rollup(self):
+        return ProviderBookingRollup.objects.get(provider=self.provider)
+
+    def test_every_transition_moves_the_rollup(self):
+        today = date.today()
+        first = self.book(today + timedelta(days=3), today + timedelta(days=5)).data['id']
+        second = self.book(today + timedelta(days=6), today + timedelta(days=7)).data['id']
+        third = self.book(today + timedelta(days=8), today + timedelta(days=9)).data['id']
+        self.assertEqual(self.rollup().pending_count, 3)
+
+        self.client.force_authenticate(self.host)
+        self.client.post(reverse('confirm-room-booking', args=[first]))
+        self.client.post(reverse('reject-room-booking', args=[second]))
+        self.client.force_authenticate(self.guest)
+        self.client.post(reverse('cancel-room-booking', args=[third]))
+
+        rollup = self.rollup()
+        self.assertEqual(
+            (rollup.pending_count, rollup.confirmed_count, rollup.rejected_count, rollup.cancelled_count),
+            (0, 1, 1, 1),
+        )
+        self.assertEqual(rollup.revenue, 200)
+
+        RoomBooking.objects.filter(id=first).update(check_out=today - timedelta(days=1))
+        auto_complete_finished_bookings()
+        rollup = self.rollup()
+        self.assertEqual((rollup.confirmed_count, rollup.completed_count), (0, 1))
+        self.assertEqual(rollup.revenue, 200)
+
+    def test_dashboard_reads_the_rollup(self):
+        today = date.today()
+        self.book(today + timedelta(days=3), today + timedelta(days=4))
+        self.book(today + timedelta(days=5), today + timedelta(days=6))
+        self.client.force_authenticate(self.host)
+        url = reverse('provider-booking-dashboard', args=[self.provider.id])
+
+        # provider check, provider, rollup, upcoming count, next check ins
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data['counts']['PENDING'], 2)
+        self.assertEqual(response.data['revenue'], '0.00')
+        self.assertEqual(response.data['upcoming_check_ins'], 2)
+        self.assertEqual(len(response.data['next_check_ins']), 2)
+
+        other = self.make_provider(self.make_user('other', '0300'))
+        self.client.force_authenticate(other.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_rebuild_repairs_drift(self):
+        today = date.today()
+        self.book(today + timedelta(days=3), today + timedelta(days=4))
+        ProviderBookingRollup.objects.filter(provider=self.provider).update(pending_count=7, revenue=50)
+
+        out = StringIO()
+        call_command('rebuild_provider_rollups', stdout=out)
+        self.assertIn('Repaired 1', out.getvalue())
+        rollup = self.rollup()
+        self.assertEqual((rollup.pending_count, rollup.revenue), (1, 0))
+
+        out = StringIO()
+        call_command('rebuild_provider_rollups', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+
+class BulkBookingTransitionTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.pending = [
+            self.book(today + timedelta(days=i), today + timedelta(days=i + 1)).data['id']
+            for i in range(1, 6)
+        ]
+        other = self.make_provider(self.make_user('other', '0300'))
+        other_room = self.make_hotel_room(self.make_hotel(other))
+        self.foreign = self.book(today + timedelta(days=1), today + timedelta(days=2), room=other_room).data['id']
+        self.client.force_authenticate(self.host)
+
+    def post(self, action, ids):
+        return self.client.post(
+            reverse('bulk-booking-transition'),
+            {'action': action, 'booking_ids': ids},
+            format='json',
+        )
+
+    def test_reports_an_outcome_per_id(self):
+        RoomBooking.objects.filter(id=self.pending[0]).update(status='CANCELLED')
+        response = self.post('confirm', self.pending + [self.foreign, 999999])
+
+        results = {row['id']: row['result'] for row in response.data['results']}
+        self.assertEqual(response.data['applied'], 4)
+        self.assertEqual(results[self.pending[0]], 'wrong status')
+        self.assertEqual(results[self.foreign], 'not owned')
+        self.assertEqual(results[999999], 'not found')
+        self.assertEqual(RoomBooking.objects.filter(status='CONFIRMED').count(), 4)
+        self.assertEqual(RoomBooking.objects.get(id=self.foreign).status, 'PENDING')
+        self.assertEqual(ProviderBookingRollup.objects.get(provider=self.provider).confirmed_count, 4)
+
+    def test_reject_releases_nights(self):
+        self.post('reject', self.pending)
+        self.assertFalse(RoomNight.objects.filter(booking__in=self.pending).exists())
+        self.assertEqual(RoomBooking.objects.filter(status='REJECTED').count(), 5)
+
+    def test_oversized_id_is_a_400(self):
+        self.assertEqual(self.post('confirm', [2 ** 70]).status_code, 400)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post('confirm', self.pending[:1])
+        with CaptureQueriesContext(connection) as large:
+            self.post('confirm', self.pending[1:])
+        self.assertEqual(len(small), len(large))
+
+
+class BookingStateMachineTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.booking_id = self.book(today + timedelta(days=3), today + timedelta(days=4)).data['id']
+
+    def test_stale_second_action_loses(self):
+        confirmer = RoomBooking.objects.get(id=self.booking_id)
+        canceller = RoomBooking.objects.get(id=self.booking_id)
+
+        self.assertTrue(transition(confirmer, 'CONFIRMED'))
+        # canceller still believes the booking is PENDING
+        self.assertFalse(transition(canceller, 'CANCELLED'))
+        self.assertEqual(canceller.status, 'PENDING')
+        self.assertEqual(RoomBooking.objects.get(id=self.booking_id).status, 'CONFIRMED')
+        self.assertTrue(RoomNight.objects.filter(booking_id=self.booking_id).exists())
+
+    def test_disallowed_transition_is_refused(self):
+        booking = RoomBooking.objects.get(id=self.booking_id)
+        self.assertFalse(transition(booking, 'COMPLETED'))
+        self.assertEqual(RoomBooking.objects.get(id=self.booking_id).status, 'PENDING')
+
+    def test_update_touches_only_status_and_updated_at(self):
+        booking = RoomBooking.objects.get(id=self.booking_id)
+        with CaptureQueriesContext(connection) as queries:
+            transition(booking, 'CONFIRMED')
+
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "booking_roombooking"')]
+        self.assertEqual(len(updates), 1)
+        set_clause = updates[0].split(' WHERE ')[0]
+        self.assertIn('"status"', set_clause)
+        self.assertIn('"updated_at"', set_clause)
+        self.assertNotIn('"total_price"', set_clause)
+
+    def test_view_answers_409_when_it_loses(self):
+        self.client.force_authenticate(self.host)
+        with patch('booking.api_views.transition', return_value=False):
+            response = self.client.post(reverse('confirm-room-booking', args=[self.booking_id]))
+        self.assertEqual(response.status_code, 409)
+
+
+class BookingEventFeedTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(
+            username='admin', password='pass12345', phone='0900', full_name='Admin',
+        )
+
+    def feed(self, **params):
+        self.client.force_authenticate(self.admin)
+        return self.client.get(reverse('booking-event-feed'), params)
+
+    def test_every_insert_and_transition_is_recorded_in_order(self):
+        today = date.today()
+        booking_id = self.book(today + timedelta(days=3), today + timedelta(days=4)).data['id']
+        self.client.force_authenticate(self.host)
+        self.client.post(reverse('confirm-room-booking', args=[booking_id]))
+        self.client.force_authenticate(self.guest)
+        self.client.post(reverse('cancel-room-booking', args=[booking_id]))
+
+        events = self.feed().data['events']
+        self.assertEqual(
+            [(e['event'], e['old_status'], e['new_status']) for e in events],
+            [('CREATED', '', 'PENDING'), ('STATUS_CHANGED', 'PENDING', 'CONFIRMED'),
+             ('STATUS_CHANGED', 'CONFIRMED', 'CANCELLED')],
+        )
+        self.assertTrue(all(e['booking_id'] == booking_id for e in events))
+
+    def test_consumer_catches_up_in_batches(self):
+        today = date.today()
+        for i in range(5):
+            self.book(today + timedelta(days=i + 1), today + timedelta(days=i + 2))
+
+        seen = []
+        since = 0
+        while True:
+            data = self.feed(since=since, limit=2).data
+            seen += [e['id'] for e in data['events']]
+            since = data['next_since']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(seen, list(BookingEvent.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(self.feed(since=since).data['events'], [])
+
+    def test_feed_reads_in_commit_horizon_order(self):
+        today = date.today()
+        for i in range(2):
+            self.book(today + timedelta(days=i + 1), today + timedelta(days=i + 2))
+        # the later id was written by the earlier transaction
+        first, second = BookingEvent.objects.order_by('id')
+        BookingEvent.objects.filter(id=first.id).update(transaction_id=20)
+        BookingEvent.objects.filter(id=second.id).update(transaction_id=10)
+
+        data = self.feed(limit=1).data
+        self.assertEqual([e['id'] for e in data['events']], [second.id])
+        data = self.feed(since=data['next_since']).data
+        self.assertEqual([e['id'] for e in data['events']], [first.id])
+        self.assertEqual(self.feed(since=first.id).data['events'], [])
+
+    def test_failed_booking_writes_no_event(self):
+        today = date.today()
+        self.book(today + timedelta(days=1), today + timedelta(days=3))
+        self.book(today + timedelta(days=2), today + timedelta(days=4))
+        self.assertEqual(BookingEvent.objects.count(), 1)
+
+    def test_feed_is_admin_only(self):
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.client.get(reverse('booking-event-feed')).status_code, 403)
+
+
+class BookingExportTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        check_in = date.today() + timedelta(days=3)
+        self.make_bookings(self.provider, self.hotel, 30, check_in)
+        other = self.make_provider(self.make_user('other', '0300'))
+        self.make_bookings(other, self.make_hotel(other), 5, check_in)
+
+    def make_bookings(self, provider, hotel, count, check_in):
+        for _ in range(count):
+            RoomBooking.objects.create(
+                user=self.guest,
+                provider=provider,
+                room=self.make_hotel_room(hotel),
+                check_in=check_in,
+                check_out=check_in + timedelta(days=1),
+            )
+
+    def export(self, **params):
+        response = self.client.get(reverse('booking-export'), params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_provider_csv_is_scoped_and_named_in_one_query(self):
+        self.client.force_authenticate(self.host)
+        with CaptureQueriesContext(connection) as queries:
+            response, body = self.export(provider=999)
+
+        # names come with the bookings, no per row lookups
+        self.assertEqual(sum('booking_roombooking' in q['sql'] for q in queries), 1)
+        self.assertFalse(any(q['sql'].startswith('SELECT "listings_') for q in queries))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(
+            (rows[0]['guest_name'], rows[0]['provider_name'], rows[0]['room_name'], rows[0]['stay_name']),
+            ('Guest', 'host stays', 'Room', 'Test Hotel'),
+        )
+
+    def test_ndjson_with_filters(self):
+        RoomBooking.objects.filter(id__in=RoomBooking.objects.values('id')[:3]).update(status='CONFIRMED')
+        admin = User.objects.create_superuser(username='admin', password='x', phone='0900', full_name='Admin')
+        self.client.force_authenticate(admin)
+
+        response, body = self.export(output='ndjson', status='CONFIRMED')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['room_type_name'], 'hotelroom')
+
+        _, body = self.export(output='ndjson', check_in_from=(date.today() + timedelta(days=4)).isoformat())
+        self.assertEqual(body, '')
+
+    def test_out_of_range_provider_is_a_400(self):
+        admin = User.objects.create_superuser(username='admin', password='x', phone='0900', full_name='Admin')
+        self.client.force_authenticate(admin)
+        for provider in (0, 2 ** 70):
+            response = self.client.get(reverse('booking-export'), {'provider': provider})
+            self.assertEqual(response.status_code, 400)
+
+    def test_guests_cannot_export(self):
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.client.get(reverse('booking-export')).status_code, 403)
+
+    def test_command_streams_to_stdout(self):
+        out = StringIO()
+        call_command('export_bookings', provider=self.provider.id, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 31)
+
+
+class ArchiveBookingsTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.old = [
+            self.make_booking(today - timedelta(days=400 + i), status)
+            for i, status in enumerate(['COMPLETED', 'CANCELLED', 'REJECTED', 'COMPLETED'])
+        ]
+        self.recent = self.make_booking(today - timedelta(days=10), 'COMPLETED')
+        self.active = self.make_booking(today + timedelta(days=10), 'CONFIRMED')
+
+    def make_booking(self, check_out, status):
+        return RoomBooking.objects.create(
+            user=self.guest,
+            provider=self.provider,
+            room=self.room,
+            check_in=check_out - timedelta(days=1),
+            check_out=check_out,
+            total_price=100,
+            status=status,
+        )
+
+    def test_moves_old_terminal_bookings_in_batches(self):
+        out = StringIO()
+        call_command('archive_bookings', older_than_days=365, batch_size=3, stdout=out)
+
+        self.assertIn('Archived 4 bookings', out.getvalue())
+        self.assertEqual(
+            set(RoomBooking.objects.values_list('id', flat=True)),
+            {self.recent.id, self.active.id},
+        )
+        archived = ArchivedRoomBooking.objects.get(id=self.old[0].id)
+        self.assertEqual((archived.status, archived.created_at), ('COMPLETED', self.old[0].created_at))
+
+        # nothing left to move, a rerun is a no op
+        self.assertEqual(archive_finished_bookings(older_than_days=365), 0)
+
+    def test_history_reads_both_tables_in_order(self):
+        archive_finished_bookings(older_than_days=365)
+        self.client.force_authenticate(self.guest)
+
+        seen = []
+        response = self.client.get(reverse('my-room-bookings'), {'page_size': 2})
+        while True:
+            seen += [booking['id'] for booking in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        everything = self.old + [self.recent, self.active]
+        expected = [b.id for b in sorted(everything, key=lambda b: (b.created_at, b.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+        self.client.force_authenticate(self.host)
+        response = self.client.get(reverse('Provider-room-bookings-list', args=[self.provider.id]))
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_list_views_keep_the_queryset_contract(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.host
+        for view_class, kwargs in (
+            (MyRoomBookingsAPIView, {}),
+            (ProviderBookingsAPIView, {'provider_id': self.provider.id}),
+        ):
+            view = view_class(request=request, kwargs=kwargs, format_kwarg=None)
+            self.assertIsInstance(view.get_queryset(), QuerySet)
+            self.assertEqual(view.get_queryset().model, RoomBooking)
+
+    def test_rollup_rebuild_counts_archived_bookings(self):
+        archive_finished_bookings(older_than_days=365)
+        rebuild_provider_rollups()
+        rollup = ProviderBookingRollup.objects.get(provider=self.provider)
+        self.assertEqual((rollup.completed_count, rollup.cancelled_count), (3, 1))
+        self.assertEqual(rollup.revenue, 400)
+
+
+class RoomBookingAdminTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=3)
+        self.booking = reserve_room(self.guest, self.room, self.check_in, self.check_in + timedelta(days=2), 200)
+        self.admin = User.objects.create_superuser(
+            username='admin', password='pass12345', phone='0900', full_name='Admin',
+        )
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:booking_roombooking_change', args=[self.booking.id])
+
+    def test_admin_cancel_goes_through_the_state_machine(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'status': 'CANCELLED', '_save': 'Save'})
+        self.assertEqual(response.status_code, 302)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'CANCELLED')
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(ProviderBookingRollup.objects.get(provider=self.provider).cancelled_count, 1)
+        self.assertTrue(BookingEvent.objects.filter(booking_id=self.booking.id, new_status='CANCELLED').exists())
+
+        # the room is free again
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.book(self.check_in, self.check_in + timedelta(days=2)).status_code, 201)
+
+    def test_admin_cannot_make_a_disallowed_move(self):
+        response = self.client.post(self.url, {'status': 'COMPLETED', '_save': 'Save'})
+        self.assertEqual(response.status_code, 200)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_archive_admin_is_view_only(self):
+        archived = ArchivedRoomBooking.objects.create(
+            id=self.booking.id + 1000, user=self.guest, provider=self.provider,
+            room_type=self.booking.room_type, room_id=self.room.id,
+            check_in=self.check_in, check_out=self.check_in + timedelta(days=1),
+            total_price=100, status='COMPLETED', created_at=self.booking.created_at,
+            updated_at=self.booking.updated_at,
+        )
+        url = reverse('admin:booking_archivedroombooking_change', args=[archived.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'status': 'CANCELLED'})
+        archived.refresh_from_db()
+        self.assertEqual(archived.status, 'COMPLETED')
+        self.assertEqual(self.client.get(reverse('admin:booking_archivedroombooking_add')).status_code, 403)
+
+    def test_admin_cannot_add_or_delete(self):
+        self.assertEqual(self.client.get(reverse('admin:booking_roombooking_add')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('admin:booking_roombooking_delete', args=[self.booking.id])).status_code,
+            403,
+        )
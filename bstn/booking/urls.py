@@ -2,8 +2,13 @@ from django.urls import path
 from .api_views import (
     RoomBookingListAPIView,
     RoomBookingCreateAPIView,
+    GroupRoomBookingCreateAPIView,
     MyRoomBookingsAPIView,
     ProviderBookingsAPIView,
+    ProviderDashboardAPIView,
+    BulkBookingTransitionAPIView,
+    BookingEventFeedAPIView,
+    BookingExportAPIView,
     CancelRoomBookingAPIView,
     ConfirmRoomBookingAPIView,
     RejectRoomBookinAPIView,
@@ -13,8 +18,13 @@ from .api_views import (
 urlpatterns = [
     path('rooms/', RoomBookingListAPIView.as_view(), name='room-booking-list'),
     path('rooms/room-booking/', RoomBookingCreateAPIView.as_view(), name='room-booking-create'),
+    path('rooms/group-booking/', GroupRoomBookingCreateAPIView.as_view(), name='group-room-booking-create'),
     path('rooms/my/', MyRoomBookingsAPIView.as_view(), name='my-room-bookings'),
     path('rooms/provider/<int:provider_id>/', ProviderBookingsAPIView.as_view(), name='Provider-room-bookings-list'),
+    path('rooms/provider/<int:provider_id>/dashboard/', ProviderDashboardAPIView.as_view(), name='provider-booking-dashboard'),
+    path('rooms/provider/bulk-transition/', BulkBookingTransitionAPIView.as_view(), name='bulk-booking-transition'),
+    path('rooms/events/', BookingEventFeedAPIView.as_view(), name='booking-event-feed'),
+    path('rooms/export/', BookingExportAPIView.as_view(), name='booking-export'),
     path('rooms/<int:booking_id>/cancel', CancelRoomBookingAPIView.as_view(), name='cancel-room-booking'),
     path('rooms/<int:booking_id>/confirm', ConfirmRoomBookingAPIView.as_view(), name='confirm-room-booking'),
     path('rooms/<int:booking_id>/reject', RejectRoomBookinAPIView.as_view(), name='reject-room-booking'),
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -96,6 +97,32 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# In-memory bitmap availability index (listings/availability_index.py)
+# False keeps get_available_rooms_for_model on the SQL path
+AVAILABILITY_INDEX_ENABLED = False
+AVAILABILITY_INDEX_HORIZON_DAYS = 730
+# seconds before a full rebuild, picks up writes made by other processes
+AVAILABILITY_INDEX_MAX_AGE = 300
+
+# Search results cache (listings/search_cache.py)
+# LocMemCache evicts least recently used entries past MAX_ENTRIES. It is per
+# process: with several workers point 'search' at a shared backend (Redis,
+# Memcached) so an invalidation is seen by all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search-results',
+        'TIMEOUT': 120,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+SEARCH_CACHE_ENABLED = True
+
 ROOT_URLCONF = 'bstn.urls'
 
 TEMPLATES = [
@@ -123,9 +150,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # concurrent bookings wait for the write lock instead of failing
+            # with "database is locked" when a read upgrades to a write
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # a file, not the in-memory default, so the concurrent booking tests
+        # can open it from several threads
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# BSTN_DB_ENGINE=postgresql switches to PostgreSQL, which adds the
+# stay_range overlap index and exclusion constraint (booking migration 0005)
+# e.g. BSTN_DB_ENGINE=postgresql BSTN_DB_NAME=bstn python manage.py test booking
+if os.environ.get('BSTN_DB_ENGINE') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('BSTN_DB_NAME', 'bstn'),
+        'USER': os.environ.get('BSTN_DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('BSTN_DB_PASSWORD', ''),
+        'HOST': os.environ.get('BSTN_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('BSTN_DB_PORT', '5432'),
+    }
+
+# Finished bookings move to the archive table this many days after
+# check out (booking/archive.py, archive_bookings command)
+BOOKING_ARCHIVE_AFTER_DAYS = 365
+
 # Use my custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -0,0 +1,64 @@
+# Stay amenities packed into one integer, bit i set when AMENITIES[i] holds.
+# Bits are stored in the database: only ever append to this list.
+AMENITIES = [
+    # every stay type
+    ('wifi', lambda stay: stay.has_wifi),
+    ('parking', lambda stay: stay.has_parking),
+    ('kitchen', lambda stay: stay.has_kitchen),
+    ('pets', lambda stay: stay.pets_allowed),
+    # hotel and resort
+    ('room_service', lambda stay: getattr(stay, 'has_room_service', False)),
+    # hotel
+    ('reception_24h', lambda stay: getattr(stay, 'has_reception_24h', False)),
+    ('elevator', lambda stay: getattr(stay, 'has_elevator', False)),
+    ('restaurant', lambda stay: getattr(stay, 'has_restaurant', False)),
+    ('walk_in', lambda stay: getattr(stay, 'allows_walk_in', False)),
+    # resort
+    ('pool', lambda stay: getattr(stay, 'num_of_pools', 0) > 0),
+    ('spa', lambda stay: getattr(stay, 'has_spa', False)),
+    ('gym', lambda stay: getattr(stay, 'has_gym', False)),
+    ('sports_center', lambda stay: getattr(stay, 'has_sports_center', False)),
+    ('golf', lambda stay: getattr(stay, 'has_golf_course', False)),
+    ('buffet', lambda stay: getattr(stay, 'has_buffet', False)),
+    ('bar', lambda stay: getattr(stay, 'has_bar', False)),
+    ('all_inclusive', lambda stay: getattr(stay, 'is_all_inclusive_available', False)),
+    # homestay
+    ('host_on_property', lambda stay: getattr(stay, 'host_lives_on_property', False)),
+    ('shared_with_host', lambda stay: getattr(stay, 'is_shared_with_host', False)),
+    ('meals', lambda stay: getattr(stay, 'meals_available', 'NONE') != 'NONE'),
+    ('family_friendly', lambda stay: getattr(stay, 'family_friendly', False)),
+    ('smoking', lambda stay: getattr(stay, 'smoking_allowed', False)),
+]
+
+# amenity name -> its bit
+AMENITY_BITS = {name: 1 << i for i, (name, _) in enumerate(AMENITIES)}
+
+
+def amenity_mask_of(stay):
+    mask = 0
+    for name, holds in AMENITIES:
+        if holds(stay):
+            mask |= AMENITY_BITS[name]
+    return mask
+
+
+def parse_amenities(value):
+    """
+    Required mask from 'wifi,parking,spa'. Raises ValueError on an
+    unknown name.
+    """
+    required = 0
+    for name in filter(None, (part.strip().lower() for part in (value or '').split(','))):
+        if name not in AMENITY_BITS:
+            raise ValueError(f'Unknown amenity: {name}')
+        required |= AMENITY_BITS[name]
+    return required
+
+
+def amenity_names(mask):
+    return [name for name, bit in AMENITY_BITS.items() if mask & bit]
+
+
+def has_amenities(mask, required):
+    # the in-memory twin of the SQL amenity_mask & required = required
+    return mask & required == required
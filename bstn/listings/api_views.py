@@ -1,13 +1,29 @@
+import base64
+import json
 from datetime import datetime, date
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.urls import replace_query_param
 
+from accounts.permissions import IsAdmin
 from . import models
 from . import serializers
-from .services import get_available_rooms_for_model, search_availability_stay
+from .services import (
+    get_available_rooms_for_model,
+    get_available_room_ids_for_ranges,
+    get_stay_calendar,
+    rooms_with_amenities,
+    search_availability_stay,
+    STAY_CONFIG,
+)
+from .amenities import parse_amenities
+from .fulltext import search_terms
+from .search_cache import cached_search, get_search_cache_stats
 
 
 class HotelListCreateAPIView(generics.ListCreateAPIView):
@@ -44,14 +60,21 @@ class HomeStayRoomListCreateAPIView(generics.ListCreateAPIView):
 class AvailableRoomsAPIView(APIView):
     # Availablity engine for any room model exposed as one API endpoint.
     # GET /api/listings/rooms/available/?check_in=2024-10-01&check_out=2024-10-05&room_type=hotelroom|resortroom|homestayroom 
+    # Paginated with &cursor=<next cursor>&page_size=50, or streamed as NDJSON with &stream=true
+    # &amenities=wifi,parking keeps rooms whose stay has them all
 
     # Use this map to get model and serializer based on room_type param
+    # its order is also the order rooms are returned in, then room id
     ROOM_TYPE_MAP = {
         'hotel': (models.HotelRoom, serializers.HotelRoomSerializer),
         'resort': (models.ResortRoom, serializers.ResortRoomSerializer),
         'homestay': (models.HomeStayRoom, serializers.HomeStayRoomSerializer),
     }
 
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    STREAM_CHUNK_SIZE = 2000
+
     def get(self, request):
         # reading query params
         check_in_str = request.query_params.get('check_in')
@@ -76,43 +99,201 @@ class AvailableRoomsAPIView(APIView):
         if check_in < date.today():
             raise ValidationError('Check in date cannnot be in past!')
         
-        result = []
-        
-        # helper function to add rooms of a specific type
-        def add_rooms_for(label, model, serializer_class):
-            qs = get_available_rooms_for_model(model, check_in, check_out)
-            for room in qs:
-                data = serializer_class(room).data
-                data['room_type'] = label  # so frontend knows which type
-                result.append(data)
-
         # if specific room_type given fetch only that model
         if room_type:
             room_type = room_type.lower()
             if room_type not in self.ROOM_TYPE_MAP:
                 raise ValidationError('Invalid room type!')
-            
-            model, serializer_class = self.ROOM_TYPE_MAP[room_type]
-            add_rooms_for(room_type, model, serializer_class)
+            labels = [room_type]
         else:
             # no room type, return all types
-            for label, (model, serializer_class) in self.ROOM_TYPE_MAP.items():
-                add_rooms_for(label, model, serializer_class)
+            labels = list(self.ROOM_TYPE_MAP)
+
+        try:
+            amenities = parse_amenities(request.query_params.get('amenities'))
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        # skip what the client has already seen
+        cursor = request.query_params.get('cursor')
+        querysets = self.remaining_querysets(labels, check_in, check_out, amenities, cursor)
+
+        if request.query_params.get('stream', '').lower() in ('1', 'true'):
+            return StreamingHttpResponse(
+                self.stream_rooms(querysets),
+                content_type='application/x-ndjson',
+            )
+
+        try:
+            page_size = int(request.query_params.get('page_size', self.PAGE_SIZE))
+        except ValueError:
+            raise ValidationError('page_size must be a number')
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+
+        results, next_cursor = cached_search(
+            'rooms', labels, check_in, check_out,
+            {'room_type': room_type or '', 'amenities': amenities, 'cursor': cursor or '', 'page_size': page_size},
+            lambda: self.paginate_rooms(querysets, page_size),
+        )
+
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_url, 'results': results})
+
+    def room_queryset(self, label, check_in, check_out, amenities):
+        # plain dicts of the serializer fields, no serializer instance per room
+        model, serializer_class = self.ROOM_TYPE_MAP[label]
+        rooms = get_available_rooms_for_model(model, check_in, check_out)
+        return rooms_with_amenities(rooms, amenities).order_by('id').values(*serializer_class.Meta.fields)
+
+    def remaining_querysets(self, labels, check_in, check_out, amenities, cursor):
+        if not cursor:
+            return [(label, self.room_queryset(label, check_in, check_out, amenities)) for label in labels]
+
+        cursor_label, last_id = decode_room_cursor(cursor)
+        if cursor_label not in labels:
+            raise ValidationError('Invalid cursor')
+
+        # types before the cursor are done, the cursor type resumes after last_id
+        remaining = labels[labels.index(cursor_label):]
+        querysets = [(label, self.room_queryset(label, check_in, check_out, amenities)) for label in remaining]
+        querysets[0] = (cursor_label, querysets[0][1].filter(id__gt=last_id))
+        return querysets
+
+    def paginate_rooms(self, querysets, page_size):
+        # returns one page of rooms and the cursor of the next page, if any
+        results = []
+        for label, qs in querysets:
+            need = page_size - len(results)
+            # one extra row tells us whether another page exists
+            rows = list(qs[:need + 1])
+            for row in rows[:need]:
+                row['room_type'] = label  # so frontend knows which type
+                results.append(row)
+
+            if len(rows) > need:
+                last = results[-1]
+                return results, encode_room_cursor(last['room_type'], last['id'])
+
+        return results, None
+
+    def stream_rooms(self, querysets):
+        for label, qs in querysets:
+            for row in qs.iterator(chunk_size=self.STREAM_CHUNK_SIZE):
+                row['room_type'] = label
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+# Answers availability for many date ranges in one call
+class BatchAvailableRoomsAPIView(APIView):
+    """
+    POST /api/listings/rooms/available/batch/
+    {
+        "ranges": [{"check_in": "2024-10-01", "check_out": "2024-10-05"}, ...],
+        "room_type": "hotel|resort|homestay",   optional
+        "room_ids": [1, 2, 3],                  optional, needs room_type
+        "amenities": "wifi,parking"             optional, the stay must have them all
+    }
+
+    Responds with the free room ids of each type, keyed by "check_in/check_out".
+    """
+    def post(self, request):
+        serializer = serializers.BatchAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        ranges = [(r['check_in'], r['check_out']) for r in data['ranges']]
+        labels = [data['room_type']] if 'room_type' in data else list(AvailableRoomsAPIView.ROOM_TYPE_MAP)
+
+        result = {f'{check_in}/{check_out}': {} for check_in, check_out in ranges}
+        for label in labels:
+            model, _ = AvailableRoomsAPIView.ROOM_TYPE_MAP[label]
+            free = get_available_room_ids_for_ranges(model, ranges, data.get('room_ids'), data['amenities'])
+            for (check_in, check_out), room_ids in free.items():
+                result[f'{check_in}/{check_out}'][label] = room_ids
 
         return Response(result)
 
 
+# Month view availability for one hotel / resort / homestay
+class StayCalendarAPIView(APIView):
+    """
+    GET /api/listings/hotels/<id>/calendar/?start=2024-10-01&days=90
+    (same for resorts/ and homestay/)
+
+    For each day: how many rooms of the stay are free and the lowest
+    nightly price among them.
+    """
+    DEFAULT_DAYS = 31
+    MAX_DAYS = 366
+
+    def get(self, request, stay_type, stay_id):
+        start_str = request.query_params.get('start')
+        try:
+            start = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else date.today()
+        except ValueError:
+            raise ValidationError('Date must be in YYYY-MM-DD format')
+
+        try:
+            days = int(request.query_params.get('days', self.DEFAULT_DAYS))
+        except ValueError:
+            raise ValidationError('days must be a number')
+        if not 1 <= days <= self.MAX_DAYS:
+            raise ValidationError(f'days must be between 1 and {self.MAX_DAYS}')
+
+        stay_model = STAY_CONFIG[stay_type]['stay_model']
+        if not stay_model.objects.filter(id=stay_id).exists():
+            raise NotFound('Stay not found!')
+
+        return Response({
+            'id': stay_id,
+            'type': stay_type,
+            'start': start,
+            'days': get_stay_calendar(stay_type, stay_id, start, days),
+        })
+
+
+def encode_room_cursor(label, last_id):
+    # opaque to the client, it only hands it back
+    return base64.urlsafe_b64encode(f'{label}:{last_id}'.encode()).decode()
+
+
+def decode_room_cursor(cursor):
+    try:
+        label, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return label, int(last_id)
+    except (ValueError, UnicodeError):
+        raise ValidationError('Invalid cursor')
+
+
 # Api View for searching rooms. 
 class SearchStaysAPIView(APIView):
     """
     For given check-in, check-out dates and stay types and city it searches and 
     respond back to the frontend. 
+
+    Optional: min_rating, guests, min_price / max_price (nightly price band),
+    sort=default|name|rating|distance|relevance|price_asc|price_desc and
+    page / page_size (at most MAX_PAGE_SIZE stays per page).
+    lat, lng and radius_km (up to MAX_RADIUS_KM) keep stays around a point,
+    nearest first. amenities=wifi,parking,spa keeps stays having them all.
+    q=beach villa with spa is a full-text search, most relevant first.
     """
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 100
+    MAX_RADIUS_KM = 500
+    MAX_QUERY_LENGTH = 200
+    # room prices are integer columns
+    MAX_PRICE = 2 ** 31 - 1
+
     def get(self, request):
         check_in_str = request.query_params.get('check_in')
         check_out_str = request.query_params.get('check_out')
         room_type = request.query_params.get('room_type')
         city = request.query_params.get('city')
+        sort = request.query_params.get('sort')
+        q = request.query_params.get('q')
 
         if not check_in_str or not check_out_str:
             raise ValidationError('Check in and check out are required!')
@@ -129,11 +310,84 @@ class SearchStaysAPIView(APIView):
             raise ValidationError("check_out must be after check_in.")
         if check_in < date.today():
             raise ValidationError("check_in cannot be in the past.")
+
+        try:
+            min_rating = int(request.query_params.get('min_rating', 0))
+            guests = int(request.query_params.get('guests', 0))
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = int(request.query_params.get('page_size', self.PAGE_SIZE))
+            min_price, max_price = (
+                int(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ('min_price', 'max_price')
+            )
+        except ValueError:
+            raise ValidationError('min_rating, guests, min_price, max_price, page and page_size must be numbers')
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        for name, price in (('min_price', min_price), ('max_price', max_price)):
+            if price is not None and not 0 <= price <= self.MAX_PRICE:
+                raise ValidationError(f'{name} must be between 0 and {self.MAX_PRICE}')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise ValidationError('min_price cannot be above max_price')
+        near = self.parse_near(request.query_params)
+        if q is not None and len(q) > self.MAX_QUERY_LENGTH:
+            raise ValidationError(f'q must be at most {self.MAX_QUERY_LENGTH} characters')
+        # only the words that search anything, a stopword-only q is no q
+        q = ' '.join(search_terms(q)) or None
+        try:
+            amenities = parse_amenities(request.query_params.get('amenities'))
+        except ValueError as e:
+            raise ValidationError(str(e))
         
-        # run core search
+        # run core search, answers are cached per (dates, filters, sort, page)
+        labels = [room_type.lower()] if room_type else list(STAY_CONFIG)
         try:
-            stays = search_availability_stay(check_in, check_out, room_type, city)
+            stays = cached_search(
+                'stays', labels, check_in, check_out,
+                {
+                    'room_type': (room_type or '').lower(),
+                    'city': (city or '').lower(),
+                    'min_rating': min_rating,
+                    'guests': guests,
+                    'sort': sort or '',
+                    'page': page,
+                    'page_size': page_size,
+                    'near': near or '',
+                    'amenities': amenities,
+                    'q': q,
+                    'min_price': min_price,
+                    'max_price': max_price,
+                },
+                lambda: search_availability_stay(
+                    check_in, check_out, room_type, city,
+                    min_rating=min_rating, guests=guests, sort=sort,
+                    offset=(page - 1) * page_size, limit=page_size, near=near,
+                    amenities=amenities, q=q, min_price=min_price, max_price=max_price,
+                ),
+            )
         except ValueError as e:
             raise ValidationError(str(e))
         
         return Response(stays)
+
+    def parse_near(self, params):
+        # (lat, lng, radius_km) or None, all three or none must be given
+        values = [params.get(name) for name in ('lat', 'lng', 'radius_km')]
+        if not any(values):
+            return None
+        try:
+            latitude, longitude, radius_km = (float(value) for value in values)
+        except (TypeError, ValueError):
+            raise ValidationError('lat, lng and radius_km must be given together as numbers')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError('lat or lng out of range')
+        if not 0 < radius_km <= self.MAX_RADIUS_KM:
+            raise ValidationError(f'radius_km must be between 0 and {self.MAX_RADIUS_KM}')
+        return latitude, longitude, radius_km
+
+
+# Hit / miss counters of the search results cache
+class SearchCacheStatsAPIView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(get_search_cache_stats())
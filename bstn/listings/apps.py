@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'listings'
+
+    def ready(self):
+        # keeps the search cache and search index in step with listing edits
+        from . import signals  # noqa: F401
@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from booking.models import ACTIVE_STATUSES, RoomBooking
+
+
+class AvailabilityIndex:
+    """
+    In-process availability index.
+
+    Holds one bitset per booked room over a rolling horizon that starts
+    today, bit i standing for the night today + i. A room is free for
+    [check_in, check_out) when its bitset has no bit in common with the
+    mask of that range, so answering a query is one AND per booked room.
+    Python ints are used as the bitsets.
+
+    The index is rebuilt from active RoomBooking rows when the day rolls
+    over or when it is older than AVAILABILITY_INDEX_MAX_AGE seconds, and
+    patched in between by the booking services after each commit.
+    """
+
+    def __init__(self, horizon_days=None, max_age=None):
+        self.horizon_days = horizon_days or getattr(settings, 'AVAILABILITY_INDEX_HORIZON_DAYS', 730)
+        self.max_age = max_age or getattr(settings, 'AVAILABILITY_INDEX_MAX_AGE', 300)
+        self.lock = threading.Lock()
+        self.start = None
+        self.built_at = None
+        # room content type id -> {room id: bitset}
+        self.masks = {}
+
+    def invalidate(self):
+        with self.lock:
+            self.start = None
+            self.masks = {}
+
+    def busy_room_ids(self, room_type_id, check_in, check_out):
+        """
+        Ids of rooms of this type with a booked night in [check_in, check_out).
+        Returns None when the range is outside the horizon, the caller
+        should then fall back to SQL.
+        """
+        with self.lock:
+            self.ensure_fresh()
+            mask = self.range_mask(check_in, check_out, clip=False)
+            if mask is None:
+                return None
+            rooms = self.masks.get(room_type_id, {})
+            return [room_id for room_id, bits in rooms.items() if bits & mask]
+
+    def occupy(self, room_type_id, room_id, check_in, check_out):
+        with self.lock:
+            if self.start is None:
+                return
+            mask = self.range_mask(check_in, check_out)
+            if mask:
+                rooms = self.masks.setdefault(room_type_id, {})
+                rooms[room_id] = rooms.get(room_id, 0) | mask
+
+    def release(self, room_type_id, room_id, check_in, check_out):
+        with self.lock:
+            if self.start is None:
+                return
+            mask = self.range_mask(check_in, check_out)
+            rooms = self.masks.get(room_type_id, {})
+            if mask and room_id in rooms:
+                rooms[room_id] &= ~mask
+                if not rooms[room_id]:
+                    del rooms[room_id]
+
+    # callers below must hold self.lock
+
+    def ensure_fresh(self):
+        stale = (
+            self.start != date.today()
+            or time.monotonic() - self.built_at > self.max_age
+        )
+        if stale:
+            self.build()
+
+    def build(self):
+        start = date.today()
+        end = start + timedelta(days=self.horizon_days)
+        bookings = RoomBooking.objects.filter(
+            status__in=ACTIVE_STATUSES,
+            check_in__lt=end,
+            check_out__gt=start,
+        ).values_list('room_type_id', 'room_id', 'check_in', 'check_out')
+
+        self.start = start
+        self.masks = {}
+        for room_type_id, room_id, check_in, check_out in bookings.iterator():
+            rooms = self.masks.setdefault(room_type_id, {})
+            rooms[room_id] = rooms.get(room_id, 0) | self.range_mask(check_in, check_out)
+        self.built_at = time.monotonic()
+
+    def range_mask(self, check_in, check_out, clip=True):
+        # bits for the nights of [check_in, check_out) inside the horizon
+        first = (check_in - self.start).days
+        last = (check_out - self.start).days
+        if not clip and (first < 0 or last > self.horizon_days):
+            return None
+        first = max(first, 0)
+        last = min(last, self.horizon_days)
+        if first >= last:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+
+availability_index = AvailabilityIndex()
+
+
+def availability_index_enabled():
+    return getattr(settings, 'AVAILABILITY_INDEX_ENABLED', False)
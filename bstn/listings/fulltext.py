@@ -0,0 +1,80 @@
+import re
+
+from django.db import NotSupportedError, connections
+from django.db.models import Value
+from django.db.models.expressions import RawSQL
+
+# SQLite: an external content FTS5 table over StaySearchIndex (name,
+# search_text), kept in step by triggers. PostgreSQL: a GIN index on
+# search_vector(). Both are created by migration 0005, which has its own
+# copy of this DDL and expression: a change here needs a new migration.
+FTS_TABLE = 'listings_staysearch_fts'
+TEXT_CONFIG = 'english'
+
+# bm25 weights of the name and search_text columns
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+MAX_TERMS = 10
+
+# words that narrow nothing, "beach villa with spa" searches beach villa spa
+STOPWORDS = {
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'into', 'near', 'of',
+    'on', 'or', 'the', 'to', 'with', 'without',
+}
+
+
+def stay_search_text(stay, room_amenities=()):
+    # everything but the name, which gets its own column and weight
+    parts = [stay.description, getattr(stay, 'activities_description', ''), *room_amenities]
+    return '\n'.join(part for part in parts if part)
+
+
+def search_terms(q):
+    words = re.findall(r'\w+', (q or '').lower())
+    return [word for word in words if word not in STOPWORDS][:MAX_TERMS]
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('name', weight='A', config=TEXT_CONFIG)
+        + SearchVector('search_text', weight='B', config=TEXT_CONFIG)
+    )
+
+
+def full_text_filter(stays, q):
+    """
+    Narrow a StaySearchIndex queryset to rows matching every term of q,
+    annotated with text_rank (higher is more relevant). The match is
+    answered by the full-text index, never by scanning the table. A q
+    without search terms ("", "the") filters nothing.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return stays.annotate(text_rank=Value(0.0))
+
+    vendor = connections[stays.db].vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(' '.join(terms), config=TEXT_CONFIG)
+        return stays.annotate(text_document=search_vector()).filter(text_document=query).annotate(
+            text_rank=SearchRank(search_vector(), query),
+        )
+
+    if vendor == 'sqlite':
+        # quoted terms are matched literally, separated by spaces they are ANDed
+        match = ' '.join(f'"{term}"' for term in terms)
+        table = stays.model._meta.db_table
+        return stays.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)),
+        ).annotate(text_rank=RawSQL(
+            # bm25() is lower for better matches
+            f'SELECT -bm25({FTS_TABLE}, {NAME_WEIGHT}, {TEXT_WEIGHT}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,),
+        ))
+
+    raise NotSupportedError(f'Full-text search is not available on {vendor}')
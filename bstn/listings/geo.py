@@ -0,0 +1,111 @@
+import math
+
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+
+# The search grid: CELL_DEGREES x CELL_DEGREES cells numbered row by row
+# from (-90, -180). 0.1 degree is about 11 km north-south.
+CELL_DEGREES = 0.1
+GRID_ROWS = round(180 / CELL_DEGREES)
+GRID_COLUMNS = round(360 / CELL_DEGREES)
+
+# past this many grid rows a latitude range scan beats listing the cells
+MAX_CELL_ROWS = 50
+
+
+def parse_coordinate(value, limit):
+    """
+    Float from a free text coordinate such as '23.81', ' 90.41 ' or
+    '23.81° S', None when it is empty, malformed or beyond +/- limit.
+    """
+    if value is None:
+        return None
+    text = str(value).strip().upper().replace('°', '').strip()
+    sign = 1
+    if text[-1:] in ('N', 'S', 'E', 'W'):
+        sign = -1 if text[-1] in ('S', 'W') else 1
+        text = text[:-1].strip()
+    try:
+        number = sign * float(text)
+    except ValueError:
+        return None
+    if not math.isfinite(number) or abs(number) > limit:
+        return None
+    return number
+
+
+def grid_row(latitude):
+    return min(int((latitude + 90) // CELL_DEGREES), GRID_ROWS - 1)
+
+
+def grid_column(longitude):
+    return min(int((longitude + 180) // CELL_DEGREES), GRID_COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return grid_row(latitude) * GRID_COLUMNS + grid_column(longitude)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    (lat_min, lat_max, lng_ranges) enclosing the circle, lng_ranges being
+    one or two (min, max) pairs when the box crosses the antimeridian.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = latitude - delta_lat, latitude + delta_lat
+    if lat_min <= -90 or lat_max >= 90:
+        # the circle covers a pole, every longitude is in
+        return max(lat_min, -90), min(lat_max, 90), [(-180, 180)]
+
+    # widest longitude span of the circle, at its pole ward edge
+    delta_lng = math.degrees(
+        radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(max(abs(lat_min), abs(lat_max)))))
+    )
+    if delta_lng >= 180:
+        return lat_min, lat_max, [(-180, 180)]
+    lng_min, lng_max = longitude - delta_lng, longitude + delta_lng
+    if lng_min < -180:
+        return lat_min, lat_max, [(lng_min + 360, 180), (-180, lng_max)]
+    if lng_max > 180:
+        return lat_min, lat_max, [(lng_min, 180), (-180, lng_max - 360)]
+    return lat_min, lat_max, [(lng_min, lng_max)]
+
+
+def bounding_box_filter(latitude, longitude, radius_km, prefix=''):
+    """
+    Q selecting rows inside the bounding box of the circle: the grid cells
+    it covers (one range of cell numbers per grid row and longitude span,
+    answered by the grid_cell index) narrowed by the exact box edges.
+    """
+    lat_min, lat_max, lng_ranges = bounding_box(latitude, longitude, radius_km)
+
+    edges = Q(**{f'{prefix}latitude__range': (lat_min, lat_max)})
+    box = Q()
+    for lng_min, lng_max in lng_ranges:
+        box |= Q(**{f'{prefix}longitude__range': (lng_min, lng_max)})
+    edges &= box
+
+    rows = range(grid_row(lat_min), grid_row(lat_max) + 1)
+    if len(rows) > MAX_CELL_ROWS:
+        return edges
+
+    cells = Q()
+    for row in rows:
+        for lng_min, lng_max in lng_ranges:
+            cells |= Q(**{f'{prefix}grid_cell__range': (
+                row * GRID_COLUMNS + grid_column(lng_min),
+                row * GRID_COLUMNS + grid_column(lng_max),
+            )})
+    return cells & edges
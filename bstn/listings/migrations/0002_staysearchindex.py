@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def fill_stay_search_index(apps, schema_editor):
+    # same as listings.search_index.rebuild_stay_search_index, frozen here
+    StaySearchIndex = apps.get_model('listings', 'StaySearchIndex')
+    stays = {
+        'hotel': ('Hotel', 'hotel_rooms'),
+        'homestay': ('HomeStay', 'homestay_rooms'),
+        'resort': ('Resort', 'resort_rooms'),
+    }
+    for stay_type, (model_name, rooms) in stays.items():
+        rows = apps.get_model('listings', model_name).objects.annotate(
+            index_min_price=Min(f'{rooms}__price_per_night'),
+            index_max_price=Max(f'{rooms}__price_per_night'),
+            index_max_guests=Max(f'{rooms}__max_guest_per_room'),
+            index_room_count=Count(rooms),
+        )
+        StaySearchIndex.objects.bulk_create([
+            StaySearchIndex(
+                stay_type=stay_type,
+                stay_id=stay.id,
+                name=stay.name,
+                city=stay.city,
+                city_normalized=' '.join(stay.city.split()).lower(),
+                country=str(stay.country),
+                is_active=stay.is_active,
+                star_rating=getattr(stay, 'star_rating', None),
+                min_price=stay.index_min_price,
+                max_price=stay.index_max_price,
+                max_guests=stay.index_max_guests or 0,
+                room_count=stay.index_room_count,
+            )
+            for stay in rows.iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaySearchIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stay_type', models.CharField(choices=[('hotel', 'Hotel'), ('homestay', 'HomeStay'), ('resort', 'Resort')], max_length=10)),
+                ('stay_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=50)),
+                ('city', models.CharField(max_length=255)),
+                ('city_normalized', models.CharField(max_length=255)),
+                ('country', models.CharField(max_length=2)),
+                ('is_active', models.BooleanField(default=False)),
+                ('star_rating', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('min_price', models.IntegerField(blank=True, null=True)),
+                ('max_price', models.IntegerField(blank=True, null=True)),
+                ('max_guests', models.IntegerField(default=0)),
+                ('room_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['city_normalized', 'stay_type', 'stay_id'], name='stay_search_city_idx')],
+                'constraints': [models.UniqueConstraint(fields=('stay_type', 'stay_id'), name='unique_stay_search_row')],
+            },
+        ),
+        migrations.RunPython(fill_stay_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+import math
+
+import django.core.validators
+from django.db import migrations, models
+
+STAY_MODELS = {'hotel': 'Hotel', 'homestay': 'HomeStay', 'resort': 'Resort'}
+
+
+def parse_coordinate(value, limit):
+    # same as listings.geo.parse_coordinate, frozen here
+    if value is None:
+        return None
+    text = str(value).strip().upper().replace('°', '').strip()
+    sign = 1
+    if text[-1:] in ('N', 'S', 'E', 'W'):
+        sign = -1 if text[-1] in ('S', 'W') else 1
+        text = text[:-1].strip()
+    try:
+        number = sign * float(text)
+    except ValueError:
+        return None
+    if not math.isfinite(number) or abs(number) > limit:
+        return None
+    return number
+
+
+def parse_coordinates(apps, schema_editor):
+    # text that does not parse becomes null rather than failing the deploy
+    for model_name in STAY_MODELS.values():
+        model = apps.get_model('listings', model_name)
+        stays = list(model.objects.exclude(latitude=None, longitude=None).only('id', 'latitude', 'longitude'))
+        for stay in stays:
+            stay.latitude_value = parse_coordinate(stay.latitude, 90)
+            stay.longitude_value = parse_coordinate(stay.longitude, 180)
+        model.objects.bulk_update(stays, ['latitude_value', 'longitude_value'], batch_size=1000)
+
+
+def fill_index_coordinates(apps, schema_editor):
+    # grid numbering of listings.geo: 0.1 degree cells, row by row from (-90, -180)
+    StaySearchIndex = apps.get_model('listings', 'StaySearchIndex')
+    for stay_type, model_name in STAY_MODELS.items():
+        coordinates = {
+            stay_id: (latitude, longitude)
+            for stay_id, latitude, longitude in apps.get_model('listings', model_name).objects.exclude(
+                latitude=None,
+            ).exclude(longitude=None).values_list('id', 'latitude', 'longitude')
+        }
+        rows = []
+        for row in StaySearchIndex.objects.filter(stay_type=stay_type, stay_id__in=list(coordinates)):
+            latitude, longitude = coordinates[row.stay_id]
+            row.latitude = latitude
+            row.longitude = longitude
+            row.grid_cell = min(int((latitude + 90) // 0.1), 1799) * 3600 + min(int((longitude + 180) // 0.1), 3599)
+            rows.append(row)
+        StaySearchIndex.objects.bulk_update(rows, ['latitude', 'longitude', 'grid_cell'], batch_size=1000)
+
+
+def coordinate_fields(model_name):
+    # text columns -> parsed float columns under the same names
+    model_name = model_name.lower()
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name='latitude_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name='longitude_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
+
+
+def swap_fields(model_name):
+    model_name = model_name.lower()
+    return [
+        migrations.RemoveField(model_name=model_name, name='latitude'),
+        migrations.RemoveField(model_name=model_name, name='longitude'),
+        migrations.RenameField(model_name=model_name, old_name='latitude_value', new_name='latitude'),
+        migrations.RenameField(model_name=model_name, old_name='longitude_value', new_name='longitude'),
+        migrations.AlterField(
+            model_name=model_name,
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[
+                django.core.validators.MinValueValidator(-90),
+                django.core.validators.MaxValueValidator(90),
+            ]),
+        ),
+        migrations.AlterField(
+            model_name=model_name,
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[
+                django.core.validators.MinValueValidator(-180),
+                django.core.validators.MaxValueValidator(180),
+            ]),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_staysearchindex'),
+    ]
+
+    operations = [
+        *[op for model_name in STAY_MODELS.values() for op in coordinate_fields(model_name)],
+        migrations.RunPython(parse_coordinates, migrations.RunPython.noop),
+        *[op for model_name in STAY_MODELS.values() for op in swap_fields(model_name)],
+        migrations.AddField(
+            model_name='staysearchindex',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staysearchindex',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staysearchindex',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='staysearchindex',
+            index=models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='stay_search_grid_idx'),
+        ),
+        migrations.RunPython(fill_index_coordinates, migrations.RunPython.noop),
+    ]
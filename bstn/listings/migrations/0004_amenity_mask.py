@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+# listings.amenities as of this migration, frozen here: bit i is AMENITIES[i]
+AMENITIES = [
+    ('wifi', lambda stay: stay.has_wifi),
+    ('parking', lambda stay: stay.has_parking),
+    ('kitchen', lambda stay: stay.has_kitchen),
+    ('pets', lambda stay: stay.pets_allowed),
+    ('room_service', lambda stay: getattr(stay, 'has_room_service', False)),
+    ('reception_24h', lambda stay: getattr(stay, 'has_reception_24h', False)),
+    ('elevator', lambda stay: getattr(stay, 'has_elevator', False)),
+    ('restaurant', lambda stay: getattr(stay, 'has_restaurant', False)),
+    ('walk_in', lambda stay: getattr(stay, 'allows_walk_in', False)),
+    ('pool', lambda stay: getattr(stay, 'num_of_pools', 0) > 0),
+    ('spa', lambda stay: getattr(stay, 'has_spa', False)),
+    ('gym', lambda stay: getattr(stay, 'has_gym', False)),
+    ('sports_center', lambda stay: getattr(stay, 'has_sports_center', False)),
+    ('golf', lambda stay: getattr(stay, 'has_golf_course', False)),
+    ('buffet', lambda stay: getattr(stay, 'has_buffet', False)),
+    ('bar', lambda stay: getattr(stay, 'has_bar', False)),
+    ('all_inclusive', lambda stay: getattr(stay, 'is_all_inclusive_available', False)),
+    ('host_on_property', lambda stay: getattr(stay, 'host_lives_on_property', False)),
+    ('shared_with_host', lambda stay: getattr(stay, 'is_shared_with_host', False)),
+    ('meals', lambda stay: getattr(stay, 'meals_available', 'NONE') != 'NONE'),
+    ('family_friendly', lambda stay: getattr(stay, 'family_friendly', False)),
+    ('smoking', lambda stay: getattr(stay, 'smoking_allowed', False)),
+]
+
+STAY_MODELS = {'hotel': 'Hotel', 'homestay': 'HomeStay', 'resort': 'Resort'}
+
+
+def amenity_mask_of(stay):
+    return sum(1 << i for i, (_, holds) in enumerate(AMENITIES) if holds(stay))
+
+
+def fill_amenity_masks(apps, schema_editor):
+    StaySearchIndex = apps.get_model('listings', 'StaySearchIndex')
+    for stay_type, model_name in STAY_MODELS.items():
+        model = apps.get_model('listings', model_name)
+        stays = list(model.objects.all())
+        for stay in stays:
+            stay.amenity_mask = amenity_mask_of(stay)
+        model.objects.bulk_update(stays, ['amenity_mask'], batch_size=1000)
+
+        masks = {stay.id: stay.amenity_mask for stay in stays}
+        rows = list(StaySearchIndex.objects.filter(stay_type=stay_type))
+        for row in rows:
+            row.amenity_mask = masks.get(row.stay_id, 0)
+        StaySearchIndex.objects.bulk_update(rows, ['amenity_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_numeric_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homestay',
+            name='amenity_mask',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='amenity_mask',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='resort',
+            name='amenity_mask',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='staysearchindex',
+            name='amenity_mask',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(fill_amenity_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+# listings.fulltext as of this migration, frozen here
+FTS_TABLE = 'listings_staysearch_fts'
+TEXT_CONFIG = 'english'
+
+# stay type -> (stay model, room model, room foreign key to the stay)
+STAY_MODELS = {
+    'hotel': ('Hotel', 'HotelRoom', 'hotel_id'),
+    'homestay': ('HomeStay', 'HomeStayRoom', 'homestay_id'),
+    'resort': ('Resort', 'ResortRoom', 'resort_id'),
+}
+
+GIN_INDEX_NAME = 'stay_search_text_gin'
+
+# external content FTS5 table over the index rows, the triggers keep it in
+# step with every insert, delete and name / search_text update
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, search_text,
+        content='listings_staysearchindex', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON listings_staysearchindex BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, search_text) VALUES (new.id, new.name, new.search_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON listings_staysearchindex BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, search_text)
+        VALUES ('delete', old.id, old.name, old.search_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name, search_text ON listings_staysearchindex BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, search_text)
+        VALUES ('delete', old.id, old.name, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, name, search_text) VALUES (new.id, new.name, new.search_text);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def stay_search_text(stay, room_amenities=()):
+    parts = [stay.description, getattr(stay, 'activities_description', ''), *room_amenities]
+    return '\n'.join(part for part in parts if part)
+
+
+def search_vector():
+    # the expression the PostgreSQL queries must use to hit the GIN index
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('name', weight='A', config=TEXT_CONFIG)
+        + SearchVector('search_text', weight='B', config=TEXT_CONFIG)
+    )
+
+
+def fill_search_text(apps, schema_editor):
+    StaySearchIndex = apps.get_model('listings', 'StaySearchIndex')
+    for stay_type, (stay_model_name, room_model_name, stay_fk) in STAY_MODELS.items():
+        stays = apps.get_model('listings', stay_model_name).objects.in_bulk()
+        room_amenities = {}
+        rooms = apps.get_model('listings', room_model_name).objects.exclude(amenities='').order_by('id')
+        for stay_id, amenities in rooms.values_list(stay_fk, 'amenities'):
+            room_amenities.setdefault(stay_id, []).append(amenities)
+
+        rows = list(StaySearchIndex.objects.filter(stay_type=stay_type))
+        for row in rows:
+            stay = stays.get(row.stay_id)
+            if stay is not None:
+                row.search_text = stay_search_text(stay, room_amenities.get(stay.id, ()))
+        StaySearchIndex.objects.bulk_update(rows, ['search_text'], batch_size=1000)
+
+
+def create_full_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+
+        schema_editor.add_index(
+            apps.get_model('listings', 'StaySearchIndex'),
+            GinIndex(search_vector(), name=GIN_INDEX_NAME),
+        )
+
+
+def drop_full_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_amenity_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staysearchindex',
+            name='search_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
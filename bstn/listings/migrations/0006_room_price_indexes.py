@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_stay_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='homestayroom',
+            index=models.Index(fields=['homestay', 'price_per_night'], name='homestayroom_stay_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelroom',
+            index=models.Index(fields=['hotel', 'price_per_night'], name='hotelroom_stay_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resortroom',
+            index=models.Index(fields=['resort', 'price_per_night'], name='resortroom_stay_price_idx'),
+        ),
+    ]
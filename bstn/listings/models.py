@@ -1,7 +1,10 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from accounts.models import ProviderProfile
 from django_countries.fields import CountryField
 
+from .amenities import amenity_mask_of
+
 # Hotel and Homestay model, Basestay model holds all common fields
 
 
@@ -26,14 +29,24 @@ class BaseStay(models.Model):
     address = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
     country = CountryField()
-    latitude = models.CharField(max_length=20, blank=True, null=True)
-    longitude = models.CharField(max_length=20, blank=True, null=True)
+    latitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
 
     # Amenities and Utils
     has_wifi = models.BooleanField(default=False)
     has_parking = models.BooleanField(default=False)
     has_kitchen = models.BooleanField(default=False)
     pets_allowed = models.BooleanField(default=False)
+    # the flags above and the type specific ones, see listings/amenities.py
+    amenity_mask = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     # media and status
     image = models.ImageField(upload_to='hotel_stay_image/img', blank=True, null=True)
@@ -43,6 +56,14 @@ class BaseStay(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        # keep the mask in step with the amenity flags
+        self.amenity_mask = amenity_mask_of(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'amenity_mask' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'amenity_mask']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
     
@@ -194,6 +215,12 @@ class HotelRoom(Room):
     
     room_type = models.CharField(max_length=20, choices=ROOM_TYPE)
 
+    class Meta:
+        indexes = [
+            # free rooms of a stay in a price band, see search_availability_stay
+            models.Index(fields=['hotel', 'price_per_night'], name='hotelroom_stay_price_idx'),
+        ]
+
     def __str__(self):
         return f"{self.hotel.name} - {self.room_name}"
     
@@ -215,6 +242,12 @@ class ResortRoom(Room):
     
     villa_type = models.CharField(max_length=30, choices=VILLA_TYPES)
 
+    class Meta:
+        indexes = [
+            # free rooms of a stay in a price band, see search_availability_stay
+            models.Index(fields=['resort', 'price_per_night'], name='resortroom_stay_price_idx'),
+        ]
+
     def __str__(self):
         return f"{self.resort.name} - {self.room_name}"
     
@@ -225,5 +258,65 @@ class HomeStayRoom(Room):
         on_delete=models.CASCADE, 
         related_name='homestay_rooms')
 
+    class Meta:
+        indexes = [
+            # free rooms of a stay in a price band, see search_availability_stay
+            models.Index(fields=['homestay', 'price_per_night'], name='homestayroom_stay_price_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.homestay.name} - {self.room_name}"
+
+# One row per stay of any type, kept in step by listings/search_index.py
+
+
+class StaySearchIndex(models.Model):
+    STAY_TYPES = [
+        ('hotel', 'Hotel'),
+        ('homestay', 'HomeStay'),
+        ('resort', 'Resort'),
+    ]
+
+    stay_type = models.CharField(max_length=10, choices=STAY_TYPES)
+    stay_id = models.PositiveIntegerField()
+
+    # copied from the stay
+    name = models.CharField(max_length=50)
+    city = models.CharField(max_length=255)
+    # lower case, single spaced, searched with =
+    city_normalized = models.CharField(max_length=255)
+    country = models.CharField(max_length=2)
+    is_active = models.BooleanField(default=False)
+    star_rating = models.PositiveSmallIntegerField(blank=True, null=True)
+    amenity_mask = models.BigIntegerField(default=0, db_index=True)
+    # description, activities and room amenities, see listings/fulltext.py.
+    # On SQLite triggers feed the FTS5 table: a migration that remakes this
+    # table drops them and must create them again (migration 0005).
+    search_text = models.TextField(blank=True)
+
+    # coordinates and their listings.geo grid cell, null when unknown
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    grid_cell = models.IntegerField(blank=True, null=True)
+
+    # aggregated over the stay's rooms, null prices when it has none
+    min_price = models.IntegerField(blank=True, null=True)
+    max_price = models.IntegerField(blank=True, null=True)
+    max_guests = models.IntegerField(default=0)
+    room_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stay_type', 'stay_id'], name='unique_stay_search_row'),
+        ]
+        indexes = [
+            # city searches in the default (type, id) order
+            models.Index(fields=['city_normalized', 'stay_type', 'stay_id'], name='stay_search_city_idx'),
+            # radius searches, bounding box prefilter
+            models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='stay_search_grid_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.homestay.name} - {self.room_name}"
\ No newline at end of file
+        return f"{self.stay_type} #{self.stay_id} -> {self.name}"
@@ -0,0 +1,147 @@
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+
+# room model name (ContentType.model) -> search room type label
+ROOM_MODEL_LABELS = {
+    'hotelroom': 'hotel',
+    'resortroom': 'resort',
+    'homestayroom': 'homestay',
+}
+
+HITS_KEY = 'search-stats:hits'
+MISSES_KEY = 'search-stats:misses'
+
+
+def search_cache():
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'search')]
+
+
+def search_cache_enabled():
+    return getattr(settings, 'SEARCH_CACHE_ENABLED', True)
+
+
+def make_key(kind, params):
+    raw = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+    return f'search:{kind}:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+# Generations: a search key embeds the current generation of every room type
+# label it reads and of every night it covers. Invalidating replaces those
+# generations, so old entries are never looked up again and simply age out.
+# Nothing lists the cached keys, which keeps this correct on any shared
+# backend and when the LRU culls entries.
+
+def label_generation_key(label):
+    return f'search-gen:{label}'
+
+
+def night_generation_key(label, night):
+    return f'search-gen:{label}:{night.isoformat()}'
+
+
+def generation_keys(labels, check_in, check_out):
+    nights = [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+    return [
+        key
+        for label in sorted(labels)
+        for key in [label_generation_key(label), *(night_generation_key(label, night) for night in nights)]
+    ]
+
+
+def current_generations(cache, keys):
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # a fresh random token, an evicted generation never comes back as an old one
+        cache.set_many({key: uuid.uuid4().hex for key in missing}, timeout=None)
+        generations.update(cache.get_many(missing))
+    return [generations.get(key, '') for key in keys]
+
+
+def cached_search(kind, labels, check_in, check_out, params, compute):
+    """
+    Return the cached answer for this search or compute and cache it.
+
+    Entries live in the 'search' cache (bounded LRU with a TTL) under a
+    key that includes the generations of their room type labels and
+    nights, so a booking change only misses overlapping entries.
+    """
+    if not search_cache_enabled():
+        return compute()
+
+    cache = search_cache()
+    generations = current_generations(cache, generation_keys(labels, check_in, check_out))
+    key = make_key(kind, {
+        **params,
+        'check_in': check_in,
+        'check_out': check_out,
+        'generations': ','.join(generations),
+    })
+    value = cache.get(key)
+    if value is not None:
+        incr(cache, HITS_KEY)
+        return value
+
+    incr(cache, MISSES_KEY)
+    value = compute()
+    cache.set(key, value)
+    return value
+
+
+def invalidate_search_results(label, ranges=None):
+    """
+    Invalidate cached searches for one room type label.
+    ranges is a list of (check_in, check_out); only entries whose dates
+    overlap one of them are invalidated. None invalidates every entry of
+    the label.
+    """
+    if not search_cache_enabled():
+        return
+
+    if ranges is None:
+        keys = [label_generation_key(label)]
+    else:
+        keys = {
+            night_generation_key(label, check_in + timedelta(days=i))
+            for check_in, check_out in ranges
+            for i in range((check_out - check_in).days)
+        }
+    search_cache().set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+
+def invalidate_for_bookings(rows):
+    # rows are (room_type_id, room_id, check_in, check_out) tuples
+    ranges_by_label = {}
+    for room_type_id, _, check_in, check_out in rows:
+        label = ROOM_MODEL_LABELS.get(ContentType.objects.get_for_id(room_type_id).model)
+        if label:
+            ranges_by_label.setdefault(label, []).append((check_in, check_out))
+
+    for label, ranges in ranges_by_label.items():
+        invalidate_search_results(label, ranges)
+
+
+def get_search_cache_stats():
+    cache = search_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+def incr(cache, key):
+    # counters never expire, add() seeds them the first time
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
@@ -0,0 +1,117 @@
+from django.db.models import Count, Max, Min
+
+from .amenities import amenity_mask_of
+from .fulltext import stay_search_text
+from .geo import grid_cell
+from .models import Hotel, HotelRoom, Resort, ResortRoom, HomeStay, HomeStayRoom, StaySearchIndex
+
+# stay type -> (stay model, reverse accessor of its rooms)
+INDEXED_STAYS = {
+    'hotel': (Hotel, 'hotel_rooms'),
+    'homestay': (HomeStay, 'homestay_rooms'),
+    'resort': (Resort, 'resort_rooms'),
+}
+
+# room model -> (stay type, foreign key to its stay)
+INDEXED_ROOMS = {
+    HotelRoom: ('hotel', 'hotel_id'),
+    HomeStayRoom: ('homestay', 'homestay_id'),
+    ResortRoom: ('resort', 'resort_id'),
+}
+
+# StaySearchIndex columns filled from each stay
+INDEX_FIELDS = [
+    'name', 'city', 'city_normalized', 'country', 'is_active', 'star_rating',
+    'amenity_mask', 'search_text', 'latitude', 'longitude', 'grid_cell',
+    'min_price', 'max_price', 'max_guests', 'room_count',
+]
+
+
+def normalize_city(city):
+    return ' '.join((city or '').split()).lower()
+
+
+def indexed_stays(stay_type):
+    # stays of one type with their room aggregates, one grouped query
+    stay_model, rooms = INDEXED_STAYS[stay_type]
+    return stay_model.objects.annotate(
+        index_min_price=Min(f'{rooms}__price_per_night'),
+        index_max_price=Max(f'{rooms}__price_per_night'),
+        index_max_guests=Max(f'{rooms}__max_guest_per_room'),
+        index_room_count=Count(rooms),
+    )
+
+
+def room_amenities_by_stay(stay_type, stay_ids=None):
+    # stay id -> amenities texts of its rooms, one query
+    room_model, stay_fk = next(
+        (model, fk) for model, (room_stay_type, fk) in INDEXED_ROOMS.items() if room_stay_type == stay_type
+    )
+    room_texts = room_model.objects.exclude(amenities='')
+    if stay_ids is not None:
+        room_texts = room_texts.filter(**{f'{stay_fk}__in': stay_ids})
+
+    texts = {}
+    for stay_id, amenities in room_texts.order_by('id').values_list(stay_fk, 'amenities'):
+        texts.setdefault(stay_id, []).append(amenities)
+    return texts
+
+
+def index_row(stay_type, stay, room_amenities=()):
+    return StaySearchIndex(
+        stay_type=stay_type,
+        stay_id=stay.id,
+        name=stay.name,
+        city=stay.city,
+        city_normalized=normalize_city(stay.city),
+        country=str(stay.country),
+        is_active=stay.is_active,
+        # homestays have no stars
+        star_rating=getattr(stay, 'star_rating', None),
+        amenity_mask=amenity_mask_of(stay),
+        search_text=stay_search_text(stay, room_amenities),
+        latitude=stay.latitude,
+        longitude=stay.longitude,
+        grid_cell=grid_cell(stay.latitude, stay.longitude),
+        min_price=stay.index_min_price,
+        max_price=stay.index_max_price,
+        max_guests=stay.index_max_guests or 0,
+        room_count=stay.index_room_count,
+    )
+
+
+def refresh_stay(stay_type, stay_id):
+    """
+    Recompute the index row of one stay, or drop it when the stay is gone.
+    Costs one aggregate and one read of the stay's rooms plus one write.
+    """
+    stay = indexed_stays(stay_type).filter(id=stay_id).first()
+    if stay is None:
+        StaySearchIndex.objects.filter(stay_type=stay_type, stay_id=stay_id).delete()
+        return
+
+    row = index_row(stay_type, stay, room_amenities_by_stay(stay_type, [stay_id]).get(stay_id, ()))
+    StaySearchIndex.objects.update_or_create(
+        stay_type=stay_type,
+        stay_id=stay_id,
+        defaults={field: getattr(row, field) for field in INDEX_FIELDS},
+    )
+
+
+def rebuild_stay_search_index(batch_size=1000):
+    """
+    Drop every index row and fill the table again from the listing
+    models, one aggregated query and one room text query per stay type.
+    Returns the row count.
+    """
+    StaySearchIndex.objects.all().delete()
+    written = 0
+    for stay_type in INDEXED_STAYS:
+        room_amenities = room_amenities_by_stay(stay_type)
+        rows = [
+            index_row(stay_type, stay, room_amenities.get(stay.id, ()))
+            for stay in indexed_stays(stay_type).iterator(chunk_size=batch_size)
+        ]
+        StaySearchIndex.objects.bulk_create(rows, batch_size=batch_size)
+        written += len(rows)
+    return written
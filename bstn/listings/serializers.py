@@ -1,3 +1,5 @@
+from datetime import date
+
 from rest_framework import serializers
 
 from .models import (
@@ -9,6 +11,7 @@ from .models import (
     HomeStayRoom
     )
 from accounts.models import ProviderProfile
+from .amenities import parse_amenities
 
 
 class ProviderMiniSerizalizer(serializers.ModelSerializer):
@@ -166,15 +169,36 @@ class HomeStayRoomSerializer(serializers.ModelSerializer):
         ]
 
 
+class DateRangeSerializer(serializers.Serializer):
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
 
+    def validate(self, data):
+        if data['check_out'] <= data['check_in']:
+            raise serializers.ValidationError('Check out must be after check in')
+        if data['check_in'] < date.today():
+            raise serializers.ValidationError('Check in date cannnot be in past!')
+        return data
 
 
+class BatchAvailabilitySerializer(serializers.Serializer):
+    # Upper bound on ranges per call, one date picker month plus a day
+    MAX_RANGES = 31
 
+    ranges = DateRangeSerializer(many=True, allow_empty=False, max_length=MAX_RANGES)
+    room_type = serializers.ChoiceField(choices=['hotel', 'resort', 'homestay'], required=False)
+    room_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    amenities = serializers.CharField(required=False, allow_blank=True, default='')
 
+    def validate_amenities(self, value):
+        # the listings.amenities mask of 'wifi,parking'
+        try:
+            return parse_amenities(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
 
-
-
-
-
-
-
+    def validate(self, data):
+        # room ids are per room table, id 5 is a different room in each
+        if 'room_ids' in data and 'room_type' not in data:
+            raise serializers.ValidationError({'room_ids': 'room_ids needs room_type'})
+        return data
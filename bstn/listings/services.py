@@ -1,7 +1,40 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+from datetime import timedelta
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, Count, F, IntegerField, Max, Min, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
 from booking.models import RoomBooking
-from .models import HotelRoom, ResortRoom, HomeStayRoom
+from booking.services import ACTIVE_STATUSES, booked_room_ids, overlapping_bookings
+from .availability_index import availability_index, availability_index_enabled
+from .models import Hotel, HotelRoom, Resort, ResortRoom, HomeStay, HomeStayRoom, StaySearchIndex
+from .fulltext import full_text_filter, search_terms
+from .geo import bounding_box_filter, haversine_km
+from .search_index import normalize_city
+
+# Which stay and room models make up each stay type
+STAY_CONFIG = {
+    'hotel': {
+        'stay_model': Hotel,
+        'room_model': HotelRoom,
+        'stay_attr': 'hotel',
+        'type_label': 'hotel',
+    },
+    'homestay': {
+        'stay_model': HomeStay,
+        'room_model': HomeStayRoom,
+        'stay_attr': 'homestay',
+        'type_label': 'homestay',
+    },
+    'resort': {
+        'stay_model': Resort,
+        'room_model': ResortRoom,
+        'stay_attr': 'resort',
+        'type_label': 'resort'
+    },
+}
+
+# room model -> its foreign key to the stay
+ROOM_STAY_ATTR = {config['room_model']: config['stay_attr'] for config in STAY_CONFIG.values()}
 
 
 def get_available_rooms_for_model(room_model, check_in, check_out):
@@ -17,7 +50,8 @@ def get_available_rooms_for_model(room_model, check_in, check_out):
 
     What it does:
         1. Get content type for the room model
-        2. Query RoomBooking to find all booked rooms of this type that overlap with the requested date range
+        2. Find all rooms of this type with a booked night in the requested date range
+           (RoomNight ledger, or the stay_range GiST index on PostgreSQL)
         3. Exclude these booked rooms from the room model's objects to get available rooms
         4. Return the available rooms queryset        
    """
@@ -25,91 +59,295 @@ def get_available_rooms_for_model(room_model, check_in, check_out):
     # get room content type 
     room_ct = ContentType.objects.get_for_model(room_model)
 
+    # in-memory bitmap index when enabled, None means the range is outside its horizon
+    if availability_index_enabled():
+        booked_rooms_id = availability_index.busy_room_ids(room_ct.id, check_in, check_out)
+        if booked_rooms_id is not None:
+            return room_model.objects.exclude(id__in=booked_rooms_id)
+
     # get id for booked rooms of this type
-    booked_rooms_id = RoomBooking.objects.filter(
-        room_type=room_ct,
-        status__in=['PENDING', 'CONFIRMED'],
-        check_in__lt=check_out,
-        check_out__gt=check_in,
-    ).values_list('room_id', flat=True)
+    booked_rooms_id = booked_room_ids(room_ct, check_in, check_out)
 
     # get available rooms by excluding booked ones
     return room_model.objects.exclude(id__in=booked_rooms_id)
 
 
-def search_availability_stay(check_in, check_out, room_type=None, city=None):
+def rooms_with_amenities(rooms, amenities):
+    # rooms whose stay has every bit of the amenities mask, 0 keeps them all
+    if not amenities:
+        return rooms
+    stay_attr = ROOM_STAY_ATTR[rooms.model]
+    return rooms.alias(
+        required_amenities=F(f'{stay_attr}__amenity_mask').bitand(amenities),
+    ).filter(required_amenities=amenities)
+
+
+def get_available_room_ids_for_ranges(room_model, ranges, room_ids=None, amenities=0):
+    """
+    Docstring for get_available_room_ids_for_ranges.
+    Answer many availability questions for one room model at once.
+    Args:
+        room_model: The room model class
+        ranges: list of (check_in, check_out) date pairs
+        room_ids: optional list of room ids to restrict the answer to
+        amenities: optional listings.amenities mask the room's stay must have
+
+    Loads every active booking that overlaps the union of all ranges in
+    one query, then checks each range against that in memory.
+    Returns a dict of (check_in, check_out) -> sorted list of free room ids.
+    """
+    room_ct = ContentType.objects.get_for_model(room_model)
+    window_start = min(check_in for check_in, _ in ranges)
+    window_end = max(check_out for _, check_out in ranges)
+
+    rooms = rooms_with_amenities(room_model.objects.order_by('id'), amenities)
+    bookings = overlapping_bookings(
+        RoomBooking.objects.filter(room_type=room_ct, status__in=ACTIVE_STATUSES),
+        window_start,
+        window_end,
+    )
+    if room_ids is not None:
+        rooms = rooms.filter(id__in=room_ids)
+        bookings = bookings.filter(room_id__in=room_ids)
+
+    all_room_ids = list(rooms.values_list('id', flat=True))
+
+    # room id -> booked (check_in, check_out) pairs inside the window
+    booked = defaultdict(list)
+    for room_id, booked_in, booked_out in bookings.values_list('room_id', 'check_in', 'check_out'):
+        booked[room_id].append((booked_in, booked_out))
+
+    result = {}
+    for check_in, check_out in ranges:
+        busy = {
+            room_id
+            for room_id, stays in booked.items()
+            if any(booked_in < check_out and booked_out > check_in for booked_in, booked_out in stays)
+        }
+        result[(check_in, check_out)] = [room_id for room_id in all_room_ids if room_id not in busy]
+    return result
+
+
+# sort parameter -> ORDER BY of the stay search, (type, id) breaks ties
+STAY_SORTS = {
+    'default': ['stay_type', 'stay_id'],
+    'name': ['name', 'stay_type', 'stay_id'],
+    'rating': [F('star_rating').desc(nulls_last=True), 'stay_type', 'stay_id'],
+    # needs q, see listings.fulltext
+    'relevance': [F('text_rank').desc(), 'stay_type', 'stay_id'],
+    # by the lowest free nightly price
+    'price_asc': ['price_per_night', 'stay_type', 'stay_id'],
+    'price_desc': [F('price_per_night').desc(), 'stay_type', 'stay_id'],
+}
+
+
+def price_band(min_price=None, max_price=None, field='price_per_night'):
+    band = Q()
+    if min_price is not None:
+        band &= Q(**{f'{field}__gte': min_price})
+    if max_price is not None:
+        band &= Q(**{f'{field}__lte': max_price})
+    return band
+
+
+def available_rooms_per_stay(check_in, check_out, aggregate, guests=None, min_price=None, max_price=None):
+    """
+    Case picking, for each search index row, an aggregate over the free
+    rooms of its stay: one correlated subquery per stay type. With a price
+    band only the rooms inside it count, and the (stay, price_per_night)
+    room index finds them without reading the stay's other rooms.
+    """
+    whens = []
+    for key, cfg in STAY_CONFIG.items():
+        stay_fk = f'{cfg["stay_attr"]}_id'
+        rooms = get_available_rooms_for_model(cfg['room_model'], check_in, check_out)
+        if guests:
+            rooms = rooms.filter(max_guest_per_room__gte=guests)
+        rooms = rooms.filter(price_band(min_price, max_price))
+        whens.append(When(stay_type=key, then=Subquery(
+            rooms.filter(**{stay_fk: OuterRef('stay_id')}).order_by().values(stay_fk).annotate(
+                value=aggregate,
+            ).values('value')
+        )))
+    return Case(*whens, output_field=IntegerField())
+
+
+def search_availability_stay(check_in, check_out, room_type=None, city=None,
+                             min_rating=None, guests=None, sort=None, offset=0, limit=None,
+                             near=None, amenities=0, q=None, min_price=None, max_price=None):
     """
     Docstring for search_availability_stay
 
     Return a list of stay summaries that have at least one available room
-    in the given date range. 
-    """
+    in the given date range.
+
+    Runs as one query over StaySearchIndex, which has a row per stay of
+    every type: filters, the per stay free room count and lowest and
+    highest free price (correlated subqueries on the room tables), sort
+    and the offset/limit page are all applied in SQL.
+
+    min_price / max_price keep stays with a free room priced inside the
+    band; counts and prices are then over those rooms only.
+
+    near=(latitude, longitude, radius_km) keeps stays within the radius:
+    the grid cell index narrows the rows to the bounding box in SQL, the
+    exact haversine distance is computed for those candidates only, and
+    results are sorted by distance unless another sort is asked for.
+    Each result then carries distance_km.
+
+    amenities is a listings.amenities mask, stays must have every bit of it.
 
-    # Which room models to include
-    CONFIG = {
-        'hotel': {
-            'room_model': HotelRoom,
-            'stay_attr': 'hotel',
-            'type_label': 'hotel',
-        },
-        'homestay': {
-            'room_model': HomeStayRoom,
-            'stay_attr': 'homestay',
-            'type_label': 'homestay',
-        },
-        'resort': {
-            'room_model': ResortRoom,
-            'stay_attr': 'resort',
-            'type_label': 'resort'
-        },
-    }
+    q is free text ("beach villa with spa"): the full-text index keeps
+    stays whose name, description, activities or room amenities hold
+    every word, most relevant first unless another sort is asked for.
+    A q with no search terms left ("", "the") is the same as no q.
+    """
+    stays = StaySearchIndex.objects.all()
 
     # restrict to one type if room type is provided
     if room_type:
         room_type = room_type.lower()
-        if room_type not in CONFIG:
+        if room_type not in STAY_CONFIG:
             raise ValueError('Invalid room type')
-        types_to_use = [room_type]
-
-    # stay_id -> summary data
-    stays = {}
-
-    for key in types_to_use:
-        cfg = CONFIG[key]
-        room_model = cfg['room_model']
-        stay_attr = cfg['stay_attr']
-        type_label = cfg['type_label']
-
-        # use existing availability engine
-        available_rooms = get_available_rooms_for_model(
-            room_model,
-            check_in,
-            check_out
-            )
-
-        # for each available room
-        # find it's parent stay, applies filter, group by stay, returns a list
-        for room in available_rooms:
-            stay = getattr(room, stay_attr)
-
-            # city filter if provided
-            if city:
-                if getattr(stay, 'city', '').lower() != city.lower():
-                    continue
-
-            stay_id = stay.id
-
-            if stay_id not in stays:
-                stays[stay_id] = {
-                    'id': stay.id,
-                    'type': type_label,
-                    'name': getattr(stay, 'name', ''),
-                    'city': getattr(stay, 'city', ''),
-                    'price_per_night': room.price_per_night,
-                    'available_room_count': 1,
-                }
-            else:
-                s = stays[stay_id]
-                s['available_room_count'] += 1
-    # Return as list
-    return list(stays.values())
+        stays = stays.filter(stay_type=room_type)
+
+    # city filter if provided, an equality on the normalized city
+    if city:
+        stays = stays.filter(city_normalized=normalize_city(city))
+    if min_rating:
+        stays = stays.filter(star_rating__gte=min_rating)
+    if guests:
+        stays = stays.filter(max_guests__gte=guests)
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError('min_price cannot be above max_price')
+    if min_price is not None or max_price is not None:
+        # the index row spans every room, a cheap superset of the stays in band
+        stays = stays.filter(
+            price_band(max_price=max_price, field='min_price'),
+            price_band(min_price=min_price, field='max_price'),
+        )
+    if amenities:
+        # one predicate for any number of amenities
+        stays = stays.annotate(
+            required_amenities=F('amenity_mask').bitand(amenities),
+        ).filter(required_amenities=amenities)
+
+    if q is not None and not search_terms(q):
+        q = None
+    if q is not None:
+        stays = full_text_filter(stays, q)
+
+    if near:
+        stays = stays.filter(bounding_box_filter(*near))
+    if sort == 'distance' and not near:
+        raise ValueError('sort=distance needs a location')
+    if sort == 'relevance' and q is None:
+        raise ValueError('sort=relevance needs q')
+    if sort not in (None, 'distance') and sort not in STAY_SORTS:
+        raise ValueError('Invalid sort')
+    if sort is None and q is not None:
+        sort = 'relevance'
+
+    free_rooms = {'guests': guests, 'min_price': min_price, 'max_price': max_price}
+    stays = stays.annotate(
+        available_room_count=Coalesce(available_rooms_per_stay(check_in, check_out, Count('id'), **free_rooms), 0),
+        price_per_night=available_rooms_per_stay(check_in, check_out, Min('price_per_night'), **free_rooms),
+        max_price_per_night=available_rooms_per_stay(check_in, check_out, Max('price_per_night'), **free_rooms),
+    ).filter(
+        available_room_count__gt=0,
+    ).order_by(*STAY_SORTS.get(sort, STAY_SORTS['default'])).values(
+        'stay_id', 'stay_type', 'name', 'city', 'price_per_night', 'max_price_per_night',
+        'available_room_count', 'latitude', 'longitude',
+    )
+
+    if near:
+        # exact distances for the bounding box candidates, page in Python
+        latitude, longitude, radius_km = near
+        rows = []
+        for row in stays:
+            row['distance_km'] = round(haversine_km(latitude, longitude, row['latitude'], row['longitude']), 3)
+            if row['distance_km'] <= radius_km:
+                rows.append(row)
+        if sort in (None, 'distance'):
+            rows.sort(key=lambda row: row['distance_km'])
+        stays = rows[offset:offset + limit] if limit is not None else rows[offset:]
+    elif limit is not None:
+        stays = stays[offset:offset + limit]
+    elif offset:
+        stays = stays[offset:]
+
+    results = []
+    for row in stays:
+        result = {
+            'id': row['stay_id'],
+            'type': row['stay_type'],
+            'name': row['name'],
+            'city': row['city'],
+            'price_per_night': row['price_per_night'],
+            'max_price_per_night': row['max_price_per_night'],
+            'available_room_count': row['available_room_count'],
+        }
+        if near:
+            result['distance_km'] = row['distance_km']
+        results.append(result)
+    return results
+
+
+def get_stay_calendar(stay_type, stay_id, start, days):
+    """
+    Docstring for get_stay_calendar
+
+    Per day free room count and lowest free nightly price for one stay,
+    for the nights start .. start + days - 1.
+
+    Loads the stay's rooms and the bookings overlapping the window once.
+    Rooms are grouped by price; for each price a difference array gets +1
+    on a booking's first night and -1 on its check out, and a running sum
+    turns that into booked rooms per day. The cost is one pass over the
+    bookings plus prices x days, whatever the window length.
+    """
+    cfg = STAY_CONFIG[stay_type]
+    room_model = cfg['room_model']
+    end = start + timedelta(days=days)
+
+    rooms = dict(
+        room_model.objects.filter(**{f'{cfg["stay_attr"]}_id': stay_id}).values_list('id', 'price_per_night')
+    )
+    rooms_at_price = Counter(rooms.values())
+    prices = sorted(rooms_at_price)
+
+    bookings = overlapping_bookings(
+        RoomBooking.objects.filter(
+            room_type=ContentType.objects.get_for_model(room_model),
+            room_id__in=list(rooms),
+            status__in=ACTIVE_STATUSES,
+        ),
+        start,
+        end,
+    ).values_list('room_id', 'check_in', 'check_out')
+
+    deltas = {price: [0] * (days + 1) for price in prices}
+    for room_id, check_in, check_out in bookings:
+        delta = deltas[rooms[room_id]]
+        delta[max((check_in - start).days, 0)] += 1
+        delta[min((check_out - start).days, days)] -= 1
+
+    # free rooms per price per day, from the prefix sums
+    free_at_price = {}
+    for price in prices:
+        booked = 0
+        free = []
+        for day in range(days):
+            booked += deltas[price][day]
+            free.append(rooms_at_price[price] - booked)
+        free_at_price[price] = free
+
+    calendar = []
+    for day in range(days):
+        free_prices = [price for price in prices if free_at_price[price][day] > 0]
+        calendar.append({
+            'date': start + timedelta(days=day),
+            'free_rooms': sum(free_at_price[price][day] for price in prices),
+            'lowest_price': free_prices[0] if free_prices else None,
+        })
+    return calendar
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Hotel, HotelRoom, Resort, ResortRoom, HomeStay, HomeStayRoom
+from .search_cache import invalidate_search_results
+from .search_index import INDEXED_ROOMS, refresh_stay
+
+# stay or room model -> search room type label it feeds
+LISTING_LABELS = {
+    Hotel: 'hotel',
+    HotelRoom: 'hotel',
+    Resort: 'resort',
+    ResortRoom: 'resort',
+    HomeStay: 'homestay',
+    HomeStayRoom: 'homestay',
+}
+
+
+def evict_listing_searches(sender, instance, **kwargs):
+    # a room or stay edit can change any date, so drop the whole type
+    label = LISTING_LABELS[sender]
+    transaction.on_commit(lambda: invalidate_search_results(label))
+
+
+for listing_model in LISTING_LABELS:
+    post_save.connect(evict_listing_searches, sender=listing_model)
+    post_delete.connect(evict_listing_searches, sender=listing_model)
+
+
+# stay model -> stay type of its search index row
+STAY_TYPES = {Hotel: 'hotel', Resort: 'resort', HomeStay: 'homestay'}
+
+
+def refresh_stay_search_index(sender, instance, **kwargs):
+    # runs in the transaction of the listing write
+    if sender in STAY_TYPES:
+        refresh_stay(STAY_TYPES[sender], instance.id)
+    else:
+        stay_type, stay_fk = INDEXED_ROOMS[sender]
+        refresh_stay(stay_type, getattr(instance, stay_fk))
+
+
+for listing_model in LISTING_LABELS:
+    post_save.connect(refresh_stay_search_index, sender=listing_model)
+    post_delete.connect(refresh_stay_search_index, sender=listing_model)
@@ -1,3 +1,696 @@
-from django.test import TestCase
+import json
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from booking.tests import BookingTestMixin
+from .amenities import AMENITY_BITS, amenity_names, has_amenities, parse_amenities
+from .availability_index import availability_index
+from .geo import bounding_box, grid_cell, haversine_km, parse_coordinate
+from .models import HomeStay, HomeStayRoom, HotelRoom, Resort, StaySearchIndex
+from .search_cache import generation_keys, get_search_cache_stats, search_cache
+from .services import get_available_rooms_for_model, search_availability_stay
+
+
+class SearchAvailabilityStayTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def search(self, **kwargs):
+        return search_availability_stay(self.check_in, self.check_out, **kwargs)
+
+    def test_groups_rooms_by_stay(self):
+        self.make_hotel_room(self.hotel, price=80)
+        booked = self.make_hotel_room(self.hotel, price=50)
+        self.book(self.check_in, self.check_out, room=booked)
+
+        self.assertEqual(self.search(), [{
+            'id': self.hotel.id,
+            'type': 'hotel',
+            'name': 'Test Hotel',
+            'city': 'Dhaka',
+            'price_per_night': 80,
+            'max_price_per_night': 100,
+            'available_room_count': 2,
+        }])
+
+    def test_city_filter_is_case_insensitive(self):
+        other = self.make_hotel(self.provider, city='Sylhet')
+        self.make_hotel_room(other)
+
+        stays = self.search(room_type='hotel', city='sylhet')
+
+        self.assertEqual([stay['id'] for stay in stays], [other.id])
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        # warm the ContentType cache so only search queries are counted
+        self.search()
+
+        with CaptureQueriesContext(connection) as few_rooms:
+            self.search()
+
+        for _ in range(30):
+            self.make_hotel_room(self.make_hotel(self.provider))
+
+        with CaptureQueriesContext(connection) as many_rooms:
+            stays = self.search()
+
+        self.assertEqual(len(stays), 31)
+        self.assertEqual(len(few_rooms), len(many_rooms))
+        self.assertEqual(len(many_rooms), 1)  # one query over the search index
+
+
+class AvailableRoomsAPITests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.make_hotel_room(self.hotel)
+        homestay = HomeStay.objects.create(
+            provider=self.provider,
+            name='Test Home',
+            total_rooms=2,
+            check_in_time=time(14),
+            check_out_time=time(11),
+            address='Road 2',
+            city='Dhaka',
+            country='BD',
+        )
+        for _ in range(2):
+            HomeStayRoom.objects.create(homestay=homestay, max_guest_per_room=2, price_per_night=40)
+
+        check_in = date.today() + timedelta(days=5)
+        self.params = {
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat(),
+        }
+        self.url = reverse('available-rooms')
+
+    def test_cursor_walks_every_room_once(self):
+        seen = []
+        response = self.client.get(self.url, {**self.params, 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen += [(row['room_type'], row['id']) for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual([label for label, _ in seen], ['hotel', 'hotel', 'homestay', 'homestay'])
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(self.url, {**self.params, 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_returns_ndjson(self):
+        response = self.client.get(self.url, {**self.params, 'stream': 'true'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['room_type'] for row in rows], ['hotel', 'hotel', 'homestay', 'homestay'])
+        self.assertEqual(rows[0]['hotel'], self.hotel.id)
+
+
+@override_settings(AVAILABILITY_INDEX_ENABLED=True)
+class AvailabilityIndexTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        availability_index.invalidate()
+        self.addCleanup(availability_index.invalidate)
+        self.other_room = self.make_hotel_room(self.hotel)
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def available_ids(self, check_in=None, check_out=None):
+        rooms = get_available_rooms_for_model(
+            HotelRoom, check_in or self.check_in, check_out or self.check_out,
+        )
+        return set(rooms.values_list('id', flat=True))
+
+    def test_bookings_patch_the_index(self):
+        self.assertEqual(self.available_ids(), {self.room.id, self.other_room.id})
+        built_at = availability_index.built_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_id = self.book(self.check_in, self.check_out).data['id']
+        self.assertEqual(self.available_ids(), {self.other_room.id})
+        # the night before and the check out night stay free
+        self.assertEqual(
+            self.available_ids(self.check_out, self.check_out + timedelta(days=1)),
+            {self.room.id, self.other_room.id},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cancel-room-booking', args=[booking_id]))
+        self.assertEqual(self.available_ids(), {self.room.id, self.other_room.id})
+        self.assertEqual(availability_index.built_at, built_at)
+
+    def test_range_past_horizon_uses_sql(self):
+        far = date.today() + timedelta(days=availability_index.horizon_days + 10)
+        self.book(far, far + timedelta(days=1))
+
+        self.assertEqual(self.available_ids(far, far + timedelta(days=1)), {self.other_room.id})
+
+
+class BatchAvailableRoomsAPITests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_room = self.make_hotel_room(self.hotel)
+        self.check_in = date.today() + timedelta(days=5)
+        self.book(self.check_in, self.check_in + timedelta(days=2))
+        self.url = reverse('available-rooms-batch')
+
+    def post(self, ranges, **extra):
+        return self.client.post(self.url, {
+            'ranges': [
+                {'check_in': check_in.isoformat(), 'check_out': check_out.isoformat()}
+                for check_in, check_out in ranges
+            ],
+            'room_type': 'hotel',
+            **extra,
+        }, format='json')
+
+    def test_each_range_is_answered(self):
+        busy = (self.check_in + timedelta(days=1), self.check_in + timedelta(days=3))
+        free = (self.check_in + timedelta(days=2), self.check_in + timedelta(days=4))
+
+        response = self.post([busy, free])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            f'{busy[0]}/{busy[1]}': {'hotel': [self.other_room.id]},
+            f'{free[0]}/{free[1]}': {'hotel': [self.room.id, self.other_room.id]},
+        })
+
+    def test_room_ids_limit_the_answer(self):
+        stay = (self.check_in, self.check_in + timedelta(days=1))
+        response = self.post([stay], room_ids=[self.room.id])
+        self.assertEqual(response.data, {f'{stay[0]}/{stay[1]}': {'hotel': []}})
+
+    def test_room_ids_need_a_room_type(self):
+        response = self.client.post(self.url, {
+            'ranges': [{'check_in': self.check_in.isoformat(), 'check_out': (self.check_in + timedelta(days=1)).isoformat()}],
+            'room_ids': [self.room.id],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('room_ids', response.data)
+
+    def test_queries_do_not_grow_with_ranges(self):
+        ranges = [
+            (self.check_in + timedelta(days=i), self.check_in + timedelta(days=i + 2))
+            for i in range(20)
+        ]
+        self.post(ranges[:1])  # warm the ContentType cache
+
+        with CaptureQueriesContext(connection) as one_range:
+            self.post(ranges[:1])
+        with CaptureQueriesContext(connection) as many_ranges:
+            self.post(ranges)
+
+        self.assertEqual(len(one_range), len(many_ranges))
+
+    def test_range_count_is_capped(self):
+        stay = (self.check_in, self.check_in + timedelta(days=1))
+        self.assertEqual(self.post([stay] * 32).status_code, 400)
+
+
+class StayCalendarAPITests(BookingTestMixin, TestCase):
+
+    def test_free_rooms_and_lowest_price_per_day(self):
+        cheap = self.make_hotel_room(self.hotel, price=60)  # self.room costs 100
+        start = date.today() + timedelta(days=1)
+        self.book(start + timedelta(days=1), start + timedelta(days=3), room=cheap)
+        self.book(start + timedelta(days=2), start + timedelta(days=3))
+
+        response = self.client.get(
+            reverse('hotel-calendar', args=[self.hotel.id]),
+            {'start': start.isoformat(), 'days': 4},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(day['free_rooms'], day['lowest_price']) for day in response.data['days']],
+            [(2, 60), (1, 100), (0, None), (2, 60)],
+        )
+
+    def test_query_count_does_not_grow_with_days(self):
+        url = reverse('hotel-calendar', args=[self.hotel.id])
+        self.client.get(url, {'days': 1})  # warm the ContentType cache
+
+        with CaptureQueriesContext(connection) as one_day:
+            self.client.get(url, {'days': 1})
+        with CaptureQueriesContext(connection) as many_days:
+            self.client.get(url, {'days': 90})
+
+        self.assertEqual(len(one_day), len(many_days))
+
+    def test_unknown_stay(self):
+        response = self.client.get(reverse('resort-calendar', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchCacheTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.params = {
+            'check_in': self.check_in.isoformat(),
+            'check_out': (self.check_in + timedelta(days=2)).isoformat(),
+            'room_type': 'hotel',
+        }
+
+    def search(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse('search-stays'), self.params).data
+
+    def book(self, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return super().book(*args, **kwargs)
+
+    def test_repeat_search_is_served_from_cache(self):
+        self.search()
+        with self.assertNumQueries(0):
+            self.search()
+        self.assertEqual(get_search_cache_stats()['hits'], 1)
+        self.assertEqual(get_search_cache_stats()['misses'], 1)
+
+    def test_only_overlapping_bookings_evict(self):
+        other = self.make_hotel_room(self.hotel)
+        self.assertEqual(self.search()[0]['available_room_count'], 2)
+
+        # a later stay does not touch the cached answer
+        self.book(self.check_in + timedelta(days=2), self.check_in + timedelta(days=3))
+        self.search()
+        self.assertEqual(get_search_cache_stats()['hits'], 1)
+
+        self.book(self.check_in, self.check_in + timedelta(days=1), room=other)
+        self.assertEqual(self.search()[0]['available_room_count'], 1)
+        self.assertEqual(get_search_cache_stats()['misses'], 2)
+
+    def test_evicted_generations_never_revive_old_entries(self):
+        self.assertEqual(self.search()[0]['available_room_count'], 1)
+        # the LRU may cull generation keys, the next search must not reuse the old entry
+        search_cache().delete_many(generation_keys(['hotel'], self.check_in, self.check_in + timedelta(days=2)))
+        self.assertEqual(self.search()[0]['available_room_count'], 1)
+        self.assertEqual(get_search_cache_stats()['misses'], 2)
+
+    def test_room_save_evicts_its_type(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_hotel_room(self.hotel)
+        self.assertEqual(self.search()[0]['available_room_count'], 2)
+
+
+class StaySearchIndexTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def row(self, stay_type='hotel', stay=None):
+        return StaySearchIndex.objects.get(stay_type=stay_type, stay_id=(stay or self.hotel).id)
+
+    def make_resort(self, city, stars):
+        return Resort.objects.create(
+            provider=self.provider,
+            name=f'{city} Resort',
+            total_rooms=5,
+            check_in_time=time(14),
+            check_out_time=time(11),
+            address='Beach Road',
+            city=city,
+            country='BD',
+            star_rating=stars,
+        )
+
+    def test_listing_writes_keep_the_row_current(self):
+        self.make_hotel_room(self.hotel, price=250)
+        row = self.row()
+        self.assertEqual((row.min_price, row.max_price, row.room_count), (100, 250, 2))
+
+        self.hotel.city = '  Cox\'s   BAZAR '
+        self.hotel.save()
+        self.assertEqual(self.row().city_normalized, "cox's bazar")
+
+        self.room.delete()
+        self.assertEqual((self.row().min_price, self.row().room_count), (250, 1))
+
+        self.hotel.delete()
+        self.assertFalse(StaySearchIndex.objects.filter(stay_type='hotel').exists())
+
+    def test_rebuild_repopulates_from_scratch(self):
+        self.make_resort('Dhaka', 5)
+        StaySearchIndex.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_stay_search_index', stdout=out)
+
+        self.assertIn('Indexed 2 stays', out.getvalue())
+        self.assertEqual(self.row().room_count, 1)
+        self.assertEqual(StaySearchIndex.objects.get(stay_type='resort').room_count, 0)
+
+    def test_filter_sort_and_page_in_one_query(self):
+        for stars in (3, 5, 4):
+            resort = self.make_resort('Dhaka', stars)
+            resort.resort_rooms.create(max_guest_per_room=4, price_per_night=300, villa_type='MODERN VILLA')
+
+        with self.assertNumQueries(1):
+            stays = search_availability_stay(
+                self.check_in, self.check_out,
+                city='DHAKA', min_rating=4, guests=3, sort='rating', offset=0, limit=1,
+            )
+        self.assertEqual(len(stays), 1)
+        self.assertEqual(stays[0]['type'], 'resort')
+        self.assertEqual(self.row('resort', Resort.objects.get(id=stays[0]['id'])).star_rating, 5)
+
+    def test_endpoint_pages_and_sorts(self):
+        for _ in range(3):
+            self.make_hotel_room(self.make_hotel(self.provider))
+        params = {
+            'check_in': self.check_in.isoformat(),
+            'check_out': self.check_out.isoformat(),
+            'page_size': 2,
+        }
+        first = self.client.get(reverse('search-stays'), params).data
+        second = self.client.get(reverse('search-stays'), {**params, 'page': 2}).data
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({s['id'] for s in first} & {s['id'] for s in second})
+
+        response = self.client.get(reverse('search-stays'), {**params, 'sort': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class GeoSearchTests(BookingTestMixin, TestCase):
+
+    # Dhaka, Shahbag and Narayanganj, about 2 km and 16 km apart
+    CENTER = (23.7806, 90.4193)
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+        self.place(self.hotel, 23.7925, 90.4078)
+        self.far = self.make_hotel(self.provider)
+        self.make_hotel_room(self.far)
+        self.place(self.far, 23.6238, 90.5000)
+
+    def place(self, stay, latitude, longitude):
+        stay.latitude = latitude
+        stay.longitude = longitude
+        stay.save()
+
+    def search(self, radius_km, **kwargs):
+        return search_availability_stay(self.check_in, self.check_out, near=(*self.CENTER, radius_km), **kwargs)
+
+    def test_parse_coordinate(self):
+        self.assertEqual(parse_coordinate(' 23.81 ', 90), 23.81)
+        self.assertEqual(parse_coordinate('23.5° S', 90), -23.5)
+        self.assertIsNone(parse_coordinate('north', 90))
+        self.assertIsNone(parse_coordinate('123', 90))
+
+    def test_index_row_carries_the_grid_cell(self):
+        row = StaySearchIndex.objects.get(stay_type='hotel', stay_id=self.hotel.id)
+        self.assertEqual(row.grid_cell, grid_cell(23.7925, 90.4078))
+
+    def test_radius_keeps_near_stays_sorted_by_distance(self):
+        stays = self.search(5)
+        self.assertEqual([stay['id'] for stay in stays], [self.hotel.id])
+        self.assertAlmostEqual(stays[0]['distance_km'], haversine_km(*self.CENTER, 23.7925, 90.4078), places=3)
+
+        stays = self.search(25)
+        self.assertEqual([stay['id'] for stay in stays], [self.hotel.id, self.far.id])
+
+    def test_bounding_box_prefilter_runs_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search(5)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"grid_cell" BETWEEN', queries[0]['sql'])
+
+    def test_box_across_the_antimeridian_is_split(self):
+        _, _, lng_ranges = bounding_box(0, 179.99, 10)
+        self.assertEqual(len(lng_ranges), 2)
+
+    def test_endpoint_validates_location(self):
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        response = self.client.get(reverse('search-stays'), {**params, 'lat': 23.78, 'lng': 90.41, 'radius_km': 5})
+        self.assertEqual([stay['id'] for stay in response.data], [self.hotel.id])
+        self.assertEqual(self.client.get(reverse('search-stays'), {**params, 'lat': 23.78}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search-stays'), {**params, 'sort': 'distance'}).status_code, 400)
+
+
+class AmenityMaskTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+        self.resort = Resort.objects.create(
+            provider=self.provider,
+            name='Spa Resort',
+            total_rooms=5,
+            check_in_time=time(14),
+            check_out_time=time(11),
+            address='Beach Road',
+            city='Dhaka',
+            country='BD',
+            has_wifi=True,
+            has_parking=True,
+            has_spa=True,
+            num_of_pools=2,
+        )
+        self.resort.resort_rooms.create(max_guest_per_room=2, price_per_night=300, villa_type='MODERN VILLA')
+        self.hotel.has_wifi = True
+        self.hotel.save()
+
+    def test_mask_follows_the_flags_on_save(self):
+        self.assertEqual(set(amenity_names(self.resort.amenity_mask)), {'wifi', 'parking', 'spa', 'pool'})
+
+        self.resort.has_spa = False
+        self.resort.save(update_fields=['has_spa'])
+        self.resort.refresh_from_db()
+        self.assertEqual(set(amenity_names(self.resort.amenity_mask)), {'wifi', 'parking', 'pool'})
+        row = StaySearchIndex.objects.get(stay_type='resort', stay_id=self.resort.id)
+        self.assertEqual(row.amenity_mask, self.resort.amenity_mask)
+
+    def test_search_filters_with_one_predicate(self):
+        required = parse_amenities('wifi, Spa')
+        search_availability_stay(self.check_in, self.check_out)  # warm the content type cache
+        with CaptureQueriesContext(connection) as queries:
+            stays = search_availability_stay(self.check_in, self.check_out, amenities=required)
+        self.assertEqual([stay['id'] for stay in stays], [self.resort.id])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['sql'].count('"amenity_mask" &'), 1)
+
+        stays = search_availability_stay(self.check_in, self.check_out, amenities=parse_amenities('wifi'))
+        self.assertEqual(len(stays), 2)
+
+    def test_in_memory_prefilter_agrees(self):
+        required = AMENITY_BITS['wifi'] | AMENITY_BITS['pool']
+        masks = dict(StaySearchIndex.objects.values_list('stay_id', 'amenity_mask'))
+        self.assertEqual([i for i, mask in masks.items() if has_amenities(mask, required)], [self.resort.id])
+
+    def test_room_endpoints_filter_by_stay_amenities(self):
+        dates = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        response = self.client.get(reverse('available-rooms'), {**dates, 'amenities': 'wifi,spa'})
+        self.assertEqual([(row['room_type'], row['id']) for row in response.data['results']],
+                         [('resort', self.resort.resort_rooms.get().id)])
+
+        response = self.client.post(reverse('available-rooms-batch'), {
+            'ranges': [dates], 'amenities': 'spa',
+        }, format='json')
+        self.assertEqual(response.data[f'{self.check_in}/{self.check_out}'],
+                         {'hotel': [], 'resort': [self.resort.resort_rooms.get().id], 'homestay': []})
+
+        response = self.client.post(reverse('available-rooms-batch'), {
+            'ranges': [dates], 'amenities': 'jacuzzi',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_amenity_is_rejected(self):
+        response = self.client.get(reverse('search-stays'), {
+            'check_in': self.check_in.isoformat(),
+            'check_out': self.check_out.isoformat(),
+            'amenities': 'wifi,jacuzzi',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class FullTextSearchTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+        self.resort = Resort.objects.create(
+            provider=self.provider,
+            name='Sunset Beach Villas',
+            description='Private villas a step from the sand.',
+            activities_description='Snorkeling, yoga at dawn.',
+            total_rooms=5,
+            check_in_time=time(14),
+            check_out_time=time(11),
+            address='Beach Road',
+            city='Dhaka',
+            country='BD',
+        )
+        self.villa = self.resort.resort_rooms.create(
+            max_guest_per_room=2, price_per_night=300, villa_type='MODERN VILLA', amenities='Spa bath, minibar',
+        )
+        self.hotel.description = 'Business hotel, ten minutes from the beach.'
+        self.hotel.save()
+
+    def search(self, q, **kwargs):
+        return search_availability_stay(self.check_in, self.check_out, q=q, **kwargs)
+
+    def ids(self, stays):
+        return [(stay['type'], stay['id']) for stay in stays]
+
+    def test_every_word_must_match_across_fields(self):
+        # villa is stemmed, spa comes from the room, "with" is dropped
+        self.assertEqual(self.ids(self.search('beach villa with spa')), [('resort', self.resort.id)])
+        self.assertEqual(self.ids(self.search('snorkeling')), [('resort', self.resort.id)])
+        self.assertEqual(self.search('beach golf'), [])
+
+    def test_stopword_only_q_is_no_q(self):
+        everything = search_availability_stay(self.check_in, self.check_out)
+        self.assertEqual(len(everything), 2)
+        self.assertEqual(self.search('with the'), everything)
+        self.assertEqual(self.search(''), everything)
+        with self.assertRaises(ValueError):
+            self.search('the', sort='relevance')
+
+        url = reverse('search-stays')
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        for q in ('', 'the'):
+            response = self.client.get(url, {**params, 'q': q})
+            self.assertEqual(len(response.data), 2)
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(
+            self.ids(self.search('beach')),
+            [('resort', self.resort.id), ('hotel', self.hotel.id)],
+        )
+        self.assertEqual(
+            self.ids(self.search('beach', sort='default')),
+            [('hotel', self.hotel.id), ('resort', self.resort.id)],
+        )
+
+    def test_index_follows_listing_writes(self):
+        self.assertEqual(self.search('rooftop'), [])
+        self.hotel.description = 'Rooftop pool.'
+        self.hotel.save()
+        self.assertEqual(self.ids(self.search('rooftop')), [('hotel', self.hotel.id)])
+        self.assertEqual(self.search('business'), [])
+
+        self.villa.amenities = 'Hammock'
+        self.villa.save()
+        self.assertEqual(self.search('spa'), [])
+        self.assertEqual(self.ids(self.search('hammock')), [('resort', self.resort.id)])
+
+        self.resort.delete()
+        self.assertEqual(self.search('hammock'), [])
+
+    def test_combined_with_availability(self):
+        self.villa.delete()
+        self.assertEqual(self.search('beach villa'), [])
+
+    def test_matches_come_from_the_index(self):
+        search_availability_stay(self.check_in, self.check_out)  # warm the content type cache
+        with CaptureQueriesContext(connection) as queries:
+            self.search('beach')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('LIKE', queries[0]['sql'].upper())
+
+    def test_endpoint(self):
+        url = reverse('search-stays')
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        response = self.client.get(url, {**params, 'q': 'Villas'})
+        self.assertEqual([stay['id'] for stay in response.data], [self.resort.id])
+
+        response = self.client.get(url, {**params, 'sort': 'relevance'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PriceSearchTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.check_in = date.today() + timedelta(days=5)
+        self.check_out = self.check_in + timedelta(days=2)
+        self.make_hotel_room(self.hotel, price=250)
+        self.other = self.make_hotel(self.provider)
+        booked = self.make_hotel_room(self.other, price=150)
+        self.make_hotel_room(self.other, price=400)
+        self.book(self.check_in, self.check_out, room=booked)
+
+    def search(self, **kwargs):
+        return search_availability_stay(self.check_in, self.check_out, **kwargs)
+
+    def test_prices_are_over_free_rooms(self):
+        stays = {stay['id']: stay for stay in self.search()}
+        self.assertEqual((stays[self.hotel.id]['price_per_night'], stays[self.hotel.id]['max_price_per_night']), (100, 250))
+        # the 150 room is booked
+        self.assertEqual((stays[self.other.id]['price_per_night'], stays[self.other.id]['max_price_per_night']), (400, 400))
+
+    def test_band_counts_only_rooms_inside_it(self):
+        stays = self.search(min_price=120, max_price=300)
+        self.assertEqual([stay['id'] for stay in stays], [self.hotel.id])
+        self.assertEqual((stays[0]['price_per_night'], stays[0]['available_room_count']), (250, 1))
+
+        self.assertEqual([stay['id'] for stay in self.search(min_price=300)], [self.other.id])
+        self.assertEqual([stay['id'] for stay in self.search(max_price=99)], [])
+        with self.assertRaises(ValueError):
+            self.search(min_price=300, max_price=100)
+
+    def test_price_sorts_are_applied_before_the_page(self):
+        self.assertEqual(
+            [stay['id'] for stay in self.search(sort='price_desc', limit=1)],
+            [self.other.id],
+        )
+        self.assertEqual(
+            [stay['id'] for stay in self.search(sort='price_asc', offset=1, limit=1)],
+            [self.other.id],
+        )
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan')
+    def test_band_uses_the_room_price_index(self):
+        search_availability_stay(self.check_in, self.check_out)  # warm the content type cache
+        with CaptureQueriesContext(connection) as queries:
+            self.search(min_price=120, max_price=300)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('hotelroom_stay_price_idx (hotel_id=? AND price_per_night>? AND price_per_night<?)', plan)
+
+    def test_endpoint(self):
+        url = reverse('search-stays')
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        response = self.client.get(url, {**params, 'min_price': 120, 'sort': 'price_asc'})
+        self.assertEqual([stay['id'] for stay in response.data], [self.hotel.id, self.other.id])
+
+        response = self.client.get(url, {**params, 'max_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_band_is_a_400(self):
+        url = reverse('search-stays')
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+        for band in ({'min_price': -1}, {'max_price': -50}, {'max_price': 2 ** 70},
+                     {'min_price': 300, 'max_price': 100}):
+            response = self.client.get(url, {**params, **band})
+            self.assertEqual(response.status_code, 400, band)
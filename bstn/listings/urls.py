@@ -10,6 +10,12 @@ urlpatterns = [
     path('homestay/', api_views.HomeStayListCreateAPIView.as_view(), name='homestay-list'),
     path('homestay/<int:homestay_id>/rooms/', api_views.HomeStayRoomListCreateAPIView.as_view(), name='homestay-rooms'),
 
+    path('hotels/<int:stay_id>/calendar/', api_views.StayCalendarAPIView.as_view(), {'stay_type': 'hotel'}, name='hotel-calendar'),
+    path('resorts/<int:stay_id>/calendar/', api_views.StayCalendarAPIView.as_view(), {'stay_type': 'resort'}, name='resort-calendar'),
+    path('homestay/<int:stay_id>/calendar/', api_views.StayCalendarAPIView.as_view(), {'stay_type': 'homestay'}, name='homestay-calendar'),
+
     path('rooms/available/', api_views.AvailableRoomsAPIView.as_view(), name='available-rooms'),
+    path('rooms/available/batch/', api_views.BatchAvailableRoomsAPIView.as_view(), name='available-rooms-batch'),
     path('search/stays/', api_views.SearchStaysAPIView.as_view(), name='search-stays'),
+    path('search/cache-stats/', api_views.SearchCacheStatsAPIView.as_view(), name='search-cache-stats'),
 ]
\ No newline at end of file